@@ -0,0 +1,191 @@
+"""Isolated delivery of insert callbacks.
+
+Each callback registered with Database.add_callback gets its own bounded
+queue and worker tasks, so a slow consumer (webhook, enrichment) never holds
+up ingestion or the other callbacks.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger("parser.callbacks")
+
+# What to do with a new item when the callback's queue is full
+OVERFLOW_BLOCK = "block"              # wait for space (backpressure on the insert)
+OVERFLOW_DROP_OLDEST = "drop-oldest"  # discard the oldest queued item
+OVERFLOW_SPILL = "spill"              # append to a JSON-lines file, replay later
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL)
+
+
+class CallbackWorker:
+    """Bounded queue plus worker tasks delivering inserts to one callback."""
+
+    def __init__(
+        self,
+        fn,
+        concurrency: int = 1,
+        queue_size: int = 1000,
+        overflow: str = OVERFLOW_BLOCK,
+        spill_path: Optional[str] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if overflow == OVERFLOW_SPILL and not spill_path:
+            raise ValueError("spill_path is required for the spill overflow policy")
+
+        self.fn = fn
+        self.name = getattr(fn, "__qualname__", repr(fn))
+        self.concurrency = max(1, concurrency)
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._tasks = []
+        self._spill_offset = 0
+        self._spill_pending = 0
+        # Serializes spill-file I/O, which runs in a thread off the event loop
+        self._spill_lock = asyncio.Lock()
+
+        self.delivered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self) -> None:
+        """Start the worker tasks (requires a running event loop)."""
+        if self.overflow == OVERFLOW_SPILL and os.path.exists(self.spill_path):
+            # Items spilled by a previous run are delivered first
+            with open(self.spill_path, "rb") as f:
+                self._spill_pending = sum(1 for _ in f)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, row_id: int, payload: dict) -> None:
+        """Queue an insert for delivery according to the overflow policy."""
+        item = (row_id, payload)
+        if self.overflow == OVERFLOW_SPILL and self._spill_pending:
+            # Keep FIFO order while a backlog sits on disk
+            await self._spill(item)
+            if not self._queue.full():
+                await self._refill_from_spill()
+            return
+        try:
+            self._queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow == OVERFLOW_BLOCK:
+            await self._queue.put(item)
+        elif self.overflow == OVERFLOW_DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            self._queue.put_nowait(item)
+        else:
+            await self._spill(item)
+
+    async def _spill(self, item: tuple) -> None:
+        """Append an item to the spill file."""
+        row_id, payload = item
+        line = json.dumps([row_id, payload], ensure_ascii=False, default=str) + "\n"
+        async with self._spill_lock:
+            await asyncio.to_thread(self._append_spill, line)
+            self._spill_pending += 1
+            self.spilled += 1
+
+    def _append_spill(self, line: str) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _read_spill(self, offset: int, limit: int):
+        """Read up to limit spilled lines from offset; returns (lines, new offset)."""
+        lines = []
+        with open(self.spill_path, "r", encoding="utf-8") as f:
+            f.seek(offset)
+            while len(lines) < limit:
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+            return lines, f.tell()
+
+    async def _refill_from_spill(self) -> None:
+        """Move spilled items back into the queue while it has room.
+
+        Reads as many lines as the queue has room for in one thread call.
+        Only workers take from the queue while items sit on disk, so the
+        room cannot shrink while the read is in flight.
+        """
+        async with self._spill_lock:
+            room = self._queue.maxsize - self._queue.qsize()
+            if not self._spill_pending or room <= 0:
+                return
+            limit = min(room, self._spill_pending)
+            lines, self._spill_offset = await asyncio.to_thread(
+                self._read_spill, self._spill_offset, limit
+            )
+            for line in lines:
+                row_id, payload = json.loads(line)
+                self._queue.put_nowait((row_id, payload))
+            # A short read means the file ended early (truncated by hand)
+            self._spill_pending = self._spill_pending - len(lines) if len(lines) == limit else 0
+
+            if not self._spill_pending:
+                await asyncio.to_thread(os.unlink, self.spill_path)
+                self._spill_offset = 0
+
+    async def _worker(self) -> None:
+        while True:
+            if self._spill_pending and self._queue.empty():
+                await self._refill_from_spill()
+            row_id, payload = await self._queue.get()
+            started = time.monotonic()
+            try:
+                await self.fn(row_id, payload)
+                self.delivered += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Callback {self.name} error: {e}")
+            finally:
+                latency = time.monotonic() - started
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                self._queue.task_done()
+
+    def qsize(self) -> int:
+        """Number of inserts waiting in memory for this callback."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Delivery counters and latency for this callback."""
+        calls = self.delivered + self.errors
+        return {
+            "queued": self._queue.qsize(),
+            "spill_pending": self._spill_pending,
+            "delivered": self.delivered,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "avg_latency_ms": self.total_latency / calls * 1000 if calls else 0.0,
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+    async def close(self) -> None:
+        """Deliver everything still queued or spilled, then stop the workers."""
+        # A worker may move spilled items into the queue right after join()
+        # returns, so stop only once both the disk backlog and the queue are empty
+        while True:
+            await self._queue.join()
+            if self._spill_pending:
+                await self._refill_from_spill()
+            elif self._queue.empty():
+                break
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,74 @@
+"""Commit notifications for readers in other processes.
+
+The parser serves a Unix socket; after every commit that stored new rows it
+writes the highest message id (the change-feed sequence) as a text line to
+each connected client. Readers use it only as a wake-up signal and fetch the
+rows themselves, see reader.AsyncMessageReader.tail.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Optional, Set
+
+logger = logging.getLogger("parser.changefeed")
+
+# Clients that stop reading are dropped once this much output is buffered
+_MAX_CLIENT_BUFFER = 64 * 1024
+
+
+class ChangeNotifier:
+    """Unix-socket server broadcasting the latest committed message id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.last_seq = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        """Start listening, replacing a stale socket file from a previous run."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._on_client, path=self.path)
+        logger.info(f"Change notifier listening on {self.path}")
+
+    async def _on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Register a reader until it disconnects."""
+        self._clients.add(writer)
+        # Tell the new client where the feed currently is
+        writer.write(f"{self.last_seq}\n".encode())
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def notify(self, seq: int) -> None:
+        """Wake every connected reader; called after a commit."""
+        if seq <= self.last_seq:
+            return
+        self.last_seq = seq
+        line = f"{seq}\n".encode()
+        for writer in list(self._clients):
+            if writer.transport.get_write_buffer_size() > _MAX_CLIENT_BUFFER:
+                logger.warning("Dropping change-feed client that stopped reading")
+                self._clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    async def close(self) -> None:
+        """Disconnect clients, stop the server and remove the socket file."""
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
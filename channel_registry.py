@@ -1,17 +1,57 @@
+import asyncio
 import json
 import logging
 import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
 logger = logging.getLogger("parser.registry")
 
 
+def normalize_username(username: str) -> str:
+    """Compare usernames without '@' and case (Telegram usernames are case-insensitive)."""
+    return username.lstrip("@").lower()
+
+
+def _parse_entry(value: Union[str, int]) -> Union[str, int]:
+    """Registry entry: numeric chat id (int) or username (str)."""
+    if isinstance(value, int):
+        return value
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
 class ChannelRegistry:
-    """Registry for managing active channels and bot state."""
+    """Registry for managing active channels and bot state.
+
+    Channels are listed by username or numeric chat id. Ids seen for a
+    listed username are learned from incoming messages and kept in a
+    resolution table (id -> username, title), so the hot-path check is an
+    integer set lookup, channels without a username can be tracked by id, and
+    a renamed channel keeps being ingested (its entry is updated in place).
 
-    def __init__(self, persist_file: str = "channels.json"):
+    Mutations update memory immediately. Inside a running event loop the file
+    is rewritten once per ``save_delay`` seconds at most, in a worker thread;
+    outside a loop (scripts) it is written synchronously. Writes go to a temp
+    file that is fsynced and renamed over channels.json, so a crash leaves
+    either the old or the new version, never a truncated file.
+    """
+
+    def __init__(self, persist_file: str = "channels.json", save_delay: float = 1.0):
         self.persist_file = persist_file
+        self.save_delay = save_delay
         self.enabled = True
-        self.channels = set()
+        self.channels: Set[Union[str, int]] = set()
+        # chat id -> (username, title), refreshed from incoming messages
+        self.chats: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        # Derived indexes, rebuilt by _reindex()
+        self.active_ids: Set[int] = set()
+        self._names: Dict[str, str] = {}
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._flush_now: Optional[asyncio.Event] = None
         self._load()
 
     def _load(self):
@@ -20,51 +60,237 @@ class ChannelRegistry:
             try:
                 with open(self.persist_file, "r") as f:
                     data = json.load(f)
-                    self.channels = set(data.get("channels", []))
+                    self.channels = {_parse_entry(c) for c in data.get("channels", [])}
                     self.enabled = data.get("enabled", True)
+                    self.chats = {
+                        int(chat_id): (info.get("username"), info.get("title"))
+                        for chat_id, info in data.get("chats", {}).items()
+                    }
                 logger.info(f"Loaded {len(self.channels)} channels from {self.persist_file}")
             except Exception as e:
                 logger.warning(f"Failed to load channels: {e}")
+        self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the username index and the set of active chat ids."""
+        self._names = {
+            normalize_username(entry): entry for entry in self.channels if isinstance(entry, str)
+        }
+        self.active_ids = {entry for entry in self.channels if isinstance(entry, int)}
+        self.active_ids.update(
+            chat_id for chat_id, (username, _) in self.chats.items()
+            if username and normalize_username(username) in self._names
+        )
+
+    def _snapshot(self) -> dict:
+        return {
+            "channels": sorted(self.channels, key=str),
+            "enabled": self.enabled,
+            "chats": {
+                str(chat_id): {"username": username, "title": title}
+                for chat_id, (username, title) in self.chats.items()
+            },
+        }
+
+    def _write(self, data: dict) -> None:
+        """Atomically replace the persist file with data."""
+        directory = os.path.dirname(self.persist_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(self.persist_file)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.persist_file)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if hasattr(os, "O_DIRECTORY"):
+            # Persist the rename itself
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
 
     def _save(self):
-        """Save channels to persist file."""
+        """Persist the current state (debounced inside an event loop)."""
+        self._dirty = True
         try:
-            os.makedirs(os.path.dirname(self.persist_file) or ".", exist_ok=True)
-            with open(self.persist_file, "w") as f:
-                json.dump(
-                    {
-                        "channels": list(self.channels),
-                        "enabled": self.enabled,
-                    },
-                    f,
-                    indent=2,
-                )
-        except Exception as e:
-            logger.warning(f"Failed to save channels: {e}")
-
-    def add(self, username: str) -> bool:
-        """Add a channel to the registry."""
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is None:
+            self._dirty = False
+            try:
+                self._write(self._snapshot())
+            except Exception as e:
+                logger.warning(f"Failed to save channels: {e}")
+            return
+
+        if self._save_task is None or self._save_task.done():
+            self._flush_now = asyncio.Event()
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        """Write once per save_delay while there are unsaved changes."""
+        while self._dirty:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.save_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty = False
+            # Snapshot on the loop; only the file I/O runs in the thread
+            data = self._snapshot()
+            try:
+                await asyncio.to_thread(self._write, data)
+                logger.debug(f"Saved {len(data['channels'])} channels to {self.persist_file}")
+            except Exception as e:
+                logger.warning(f"Failed to save channels: {e}")
+
+    async def flush(self) -> None:
+        """Write pending changes now; call before shutdown."""
+        if self._save_task is not None and not self._save_task.done():
+            self._flush_now.set()
+            await self._save_task
+        elif self._dirty:
+            self._dirty = False
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def _existing(self, value: Union[str, int]) -> Union[str, int]:
+        """Entry as stored in channels: '@News' and 'news' resolve to the same one."""
+        entry = _parse_entry(value)
+        if isinstance(entry, str):
+            return self._names.get(normalize_username(entry), entry)
+        return entry
+
+    def add(self, username: Union[str, int]) -> bool:
+        """Add a channel to the registry by username or numeric chat id."""
+        username = self._existing(username)
         if username in self.channels:
             logger.debug(f"Channel {username} already in registry")
             return False
         self.channels.add(username)
+        self._reindex()
         self._save()
         logger.info(f"Added channel {username}")
         return True
 
-    def remove(self, username: str) -> bool:
-        """Remove a channel from the registry."""
+    def add_many(self, usernames: Iterable[str]) -> int:
+        """Add several channels with a single save.
+
+        Returns:
+            Number of channels that were not in the registry yet
+        """
+        new = {}
+        for username in usernames:
+            entry = self._existing(username)
+            key = normalize_username(entry) if isinstance(entry, str) else entry
+            if entry not in self.channels:
+                new.setdefault(key, entry)
+        new = set(new.values())
+        if not new:
+            return 0
+        self.channels |= new
+        self._reindex()
+        self._save()
+        logger.info(f"Added {len(new)} channels")
+        return len(new)
+
+    def remove(self, username: Union[str, int]) -> bool:
+        """Remove a channel from the registry by username or numeric chat id."""
+        username = self._existing(username)
         if username not in self.channels:
             logger.debug(f"Channel {username} not in registry")
             return False
         self.channels.remove(username)
+        self._reindex()
         self._save()
         logger.info(f"Removed channel {username}")
         return True
 
+    def remove_many(self, usernames: Iterable[str]) -> int:
+        """Remove several channels with a single save.
+
+        Returns:
+            Number of channels that were removed
+        """
+        removed = self.channels & {self._existing(username) for username in usernames}
+        if not removed:
+            return 0
+        self.channels -= removed
+        self._reindex()
+        self._save()
+        logger.info(f"Removed {len(removed)} channels")
+        return len(removed)
+
     def is_active(self, username: str) -> bool:
         """Check if a channel is active (enabled and in registry)."""
-        return self.enabled and username in self.channels
+        return self.enabled and normalize_username(username) in self._names
+
+    def is_active_chat(self, chat) -> bool:
+        """Check a Pyrogram chat: by id first, learning ids of listed usernames.
+
+        Known ids are a set lookup; the cached username/title is refreshed
+        only when the message shows a different one.
+        """
+        if not self.enabled:
+            return False
+        if chat.id in self.active_ids:
+            if self.chats.get(chat.id) != (chat.username, chat.title):
+                self._observe(chat)
+            return True
+        if chat.username and normalize_username(chat.username) in self._names:
+            self._observe(chat)
+            return True
+        return False
+
+    def _observe(self, chat) -> None:
+        """Record the current username/title of an active chat."""
+        previous = self.chats.get(chat.id)
+        self.chats[chat.id] = (chat.username, chat.title)
+        self.active_ids.add(chat.id)
+
+        old_username = previous[0] if previous else None
+        if old_username and normalize_username(old_username) != normalize_username(chat.username or ""):
+            entry = self._names.get(normalize_username(old_username))
+            if entry is not None:
+                # Follow the rename so the listed name stays meaningful
+                self.channels.discard(entry)
+                self.channels.add(chat.username or chat.id)
+                self._reindex()
+            logger.info(f"Channel {chat.id} renamed: {old_username} -> {chat.username}")
+        self._save()
+
+    def resolve(self, chat_id: int) -> Tuple[Optional[str], Optional[str]]:
+        """Cached (username, title) of a chat id, (None, None) if never seen."""
+        return self.chats.get(chat_id, (None, None))
+
+    def id_for(self, username: str) -> Optional[int]:
+        """Cached chat id of a username, None if not seen yet."""
+        wanted = normalize_username(username)
+        for chat_id, (known, _) in self.chats.items():
+            if known and normalize_username(known) == wanted:
+                return chat_id
+        return None
+
+    def usernames(self) -> List[str]:
+        """Listed channels as usernames where known (ids without one stay numeric)."""
+        names = []
+        for entry in self.channels:
+            if isinstance(entry, int):
+                username = self.chats.get(entry, (None, None))[0]
+                names.append(username or str(entry))
+            else:
+                names.append(entry)
+        return sorted(names)
 
     def enable(self) -> bool:
         """Enable the bot globally."""
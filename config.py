@@ -9,6 +9,64 @@ TELEGRAM_SESSION_NAME = os.getenv("TELEGRAM_SESSION_NAME", "parser_session")
 
 DB_PATH = os.getenv("DB_PATH", "parser.db")
 
+# Write-behind: группировка вставок в одну транзакцию
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "100"))
+DB_FLUSH_INTERVAL_MS = int(os.getenv("DB_FLUSH_INTERVAL_MS", "50"))
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "10000"))
+# Ключи последних сохранённых сообщений в памяти: повторы отсекаются без запроса к БД (0 = выключено)
+DB_RECENT_KEYS = int(os.getenv("DB_RECENT_KEYS", "50000"))
+
+# Unix-сокет для уведомления внешних читателей о новых строках (пусто = выключено)
+NOTIFY_SOCKET = os.getenv("NOTIFY_SOCKET", "")
+
+# Поиск почти-дубликатов (репостов): окно в секундах (0 = выключено),
+# порог сходства текстов (Jaccard по MinHash), размер индекса и минимум слов
+NEAR_DUP_WINDOW = float(os.getenv("NEAR_DUP_WINDOW", "0"))
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "20000"))
+NEAR_DUP_MIN_WORDS = int(os.getenv("NEAR_DUP_MIN_WORDS", "8"))
+
+# Распознавание голосовых (Whisper)
+VOICE_MODEL = os.getenv("VOICE_MODEL", "medium")
+VOICE_DEVICE = os.getenv("VOICE_DEVICE", "auto")
+VOICE_COMPUTE_TYPE = os.getenv("VOICE_COMPUTE_TYPE", "int8")
+VOICE_PRELOAD = os.getenv("VOICE_PRELOAD", "true").lower() in ("1", "true", "yes")
+# Быстрая модель для коротких клипов (пусто = всегда VOICE_MODEL)
+VOICE_FAST_MODEL = os.getenv("VOICE_FAST_MODEL", "")
+VOICE_FAST_MAX_SECONDS = float(os.getenv("VOICE_FAST_MAX_SECONDS", "20"))
+# Ниже этого avg_logprob результат быстрой модели перепроверяется основной
+VOICE_MIN_AVG_LOGPROB = float(os.getenv("VOICE_MIN_AVG_LOGPROB", "-0.8"))
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "1"))
+VOICE_QUEUE_SIZE = int(os.getenv("VOICE_QUEUE_SIZE", "8"))
+# Кэш транскрипций в БД (максимум записей, LRU)
+VOICE_CACHE_SIZE = int(os.getenv("VOICE_CACHE_SIZE", "10000"))
+# Пакетная транскрибация: сколько клипов собирать и сколько максимум ждать (мс)
+VOICE_BATCH_SIZE = int(os.getenv("VOICE_BATCH_SIZE", "8"))
+VOICE_BATCH_WINDOW_MS = int(os.getenv("VOICE_BATCH_WINDOW_MS", "300"))
+
+# Метрики Prometheus: HTTP /metrics (порт 0 = выключено) и/или файл (пусто = выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+
+# Блокировка event loop дольше порога логируется со стеком (0 = выключено)
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250"))
+# Профилирование хендлеров и вызовов БД с периодическим отчётом в файл
+PROFILE = os.getenv("PROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_FILE = os.getenv("PROFILE_FILE", "logs/profile.txt")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "60"))
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "10"))
+
+# Шардирование обработки по chat id: число полос (0 = без диспетчера) и очередь полосы
+INGEST_LANES = int(os.getenv("INGEST_LANES", "0"))
+INGEST_LANE_QUEUE_SIZE = int(os.getenv("INGEST_LANE_QUEUE_SIZE", "1000"))
+
+# Правила фильтрации по каналам (JSON) и период проверки файла на изменения (сек)
+FILTER_RULES_FILE = os.getenv("FILTER_RULES_FILE", "filter_rules.json")
+FILTER_RULES_RELOAD_INTERVAL = float(os.getenv("FILTER_RULES_RELOAD_INTERVAL", "5"))
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = os.getenv("LOG_FILE", "logs/parser.log")
 
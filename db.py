@@ -1,16 +1,169 @@
+import asyncio
 import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 import aiosqlite
+from callbacks import CallbackWorker, OVERFLOW_BLOCK
+from metrics import (
+    COMMIT_BATCH_SIZE,
+    INSERT_LATENCY,
+    MESSAGES_DUPLICATE,
+    MESSAGES_INSERTED,
+    MESSAGES_NEAR_DUPLICATE,
+    QUEUE_DEPTH,
+    RECENT_KEYS,
+    RECENT_KEYS_LOOKUPS,
+    channel_label,
+)
 
 logger = logging.getLogger("parser.db")
 
+_INSERT_SQL = """
+    INSERT OR IGNORE INTO messages (
+        source, channel_id, channel_username, channel_title,
+        chat_id, message_id, text, timestamp,
+        from_user_id, from_username, from_first_name,
+        price, urgency, title, transcript, cluster_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_TAGS_SQL = "INSERT OR IGNORE INTO message_tags (tag, message_id) VALUES (?, ?)"
+
+# Derived columns added after the initial schema: name -> SQL type
+_DERIVED_COLUMNS = {
+    "price": "INTEGER",
+    "urgency": "INTEGER",
+    "title": "TEXT",
+    "transcript": "TEXT",
+    # Row id of the earlier message this one near-duplicates, see dedup.py
+    "cluster_id": "INTEGER",
+}
+
+# Marks the end of the write-behind queue on shutdown
+_STOP = object()
+
+
+def _fold_sql(column: str) -> str:
+    """SQL expression folding ё to е in a column, as filters.keyword_index.fold does."""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+class RecentMessageKeys:
+    """Bounded LRU of message keys known to be stored.
+
+    Keys are added only after a commit, for new rows and ignored duplicates
+    alike, so a hit means the unique index would drop the insert anyway.
+    A miss just falls through to INSERT OR IGNORE, which stays the source of
+    truth (e.g. for keys evicted from the cache or inserted by another process).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._keys: "OrderedDict[tuple, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(payload: dict) -> Optional[tuple]:
+        """(source, chat, message_id), None if the payload cannot be keyed."""
+        source = payload.get("source")
+        if source == "channel":
+            chat = payload.get("channel_id") or payload.get("channel_username")
+        else:
+            chat = payload.get("chat_id")
+        message_id = payload.get("message_id")
+        if chat is None or message_id is None:
+            return None
+        return source, chat, message_id
+
+    def seen(self, payload: dict) -> bool:
+        """True if the message is known to be stored already."""
+        key = self.key(payload)
+        if key is not None and key in self._keys:
+            self._keys.move_to_end(key)
+            self.hits += 1
+            RECENT_KEYS_LOOKUPS.inc("hit")
+            return True
+        self.misses += 1
+        RECENT_KEYS_LOOKUPS.inc("miss")
+        return False
+
+    def add(self, payloads: List[dict]) -> None:
+        keys = self._keys
+        for payload in payloads:
+            key = self.key(payload)
+            if key is None:
+                continue
+            keys[key] = None
+            keys.move_to_end(key)
+        while len(keys) > self.capacity:
+            keys.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._keys),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
 
 class Database:
-    """SQLite database handler for storing Telegram messages."""
+    """SQLite database handler for storing Telegram messages.
+
+    With ``write_behind=True`` inserts are queued and committed by a single
+    writer task in batches (group commit). A batch is committed as soon as the
+    queue is empty, when ``batch_size`` rows are pending, or at the latest
+    ``flush_interval_ms`` after its first row; inserts arriving during a commit
+    make up the next batch. Callers still receive the real row id.
+
+    With a ``near_duplicates`` index (dedup.NearDuplicateIndex), a new message
+    whose text is close to a recent one gets that message's row id in
+    ``cluster_id``; first messages of a cluster keep it NULL.
 
-    def __init__(self, db_path: str):
+    Keys of the last ``recent_keys`` stored messages are kept in memory, and
+    redelivered messages (reconnects, backfills overlapping live ingestion)
+    are answered as duplicates without a database round-trip.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        write_behind: bool = False,
+        batch_size: int = 100,
+        flush_interval_ms: int = 50,
+        queue_size: int = 10000,
+        transcription_cache_size: int = 10000,
+        recent_keys: int = 50000,
+        notifier=None,
+        near_duplicates=None,
+    ):
         self.db_path = db_path
         self.conn = None
-        self._callbacks: list = []
+        self._callbacks: List[CallbackWorker] = []
+
+        self.write_behind = write_behind
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_ms = max(0, flush_interval_ms)
+        self.queue_size = queue_size
+        self._queue = None
+        self._writer_task = None
+        self.transcription_cache_size = transcription_cache_size
+        # Front cache of stored (source, chat, message_id) keys, 0 = disabled
+        self.recent_keys = RecentMessageKeys(recent_keys) if recent_keys > 0 else None
+        if self.recent_keys is not None:
+            RECENT_KEYS.set_function(self.recent_keys.__len__)
+        # Optional changefeed.ChangeNotifier woken after commits with new rows
+        self.notifier = notifier
+        self.near_duplicates = near_duplicates
+        # Serializes transactions on the shared connection
+        self._write_lock = asyncio.Lock()
 
     async def init(self) -> None:
         """Initialize database and create tables if needed."""
@@ -36,11 +189,18 @@ class Database:
                 from_user_id     INTEGER,
                 from_username    TEXT,
                 from_first_name  TEXT,
-                created_at       DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at       DATETIME DEFAULT CURRENT_TIMESTAMP,
+                price            INTEGER,
+                urgency          INTEGER,
+                title            TEXT,
+                transcript       TEXT,
+                cluster_id       INTEGER
             )
             """
         )
 
+        await self._migrate_messages()
+
         # Add unique constraints via separate queries (handles NULL values better)
         await self.conn.execute(
             """
@@ -50,6 +210,14 @@ class Database:
             """
         )
 
+        # Numeric ids survive renames and cover channels without a username
+        try:
+            await self._create_channel_id_index()
+        except aiosqlite.IntegrityError:
+            # Copies stored under an old username of a renamed channel
+            await self._merge_channel_id_duplicates()
+            await self._create_channel_id_index()
+
         await self.conn.execute(
             """
             CREATE UNIQUE INDEX IF NOT EXISTS idx_private_message
@@ -64,86 +232,718 @@ class Database:
             """
         )
 
+        # Readers filter by channel and order/page by id (MessageReader.query),
+        # so (channel, id) serves each page straight from the index without a
+        # sort; it also covers channel-only lookups
         await self.conn.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages(channel_username)
+            CREATE INDEX IF NOT EXISTS idx_messages_channel_id
+            ON messages(channel_username, id)
+            """
+        )
+
+        await self.conn.execute("DROP INDEX IF EXISTS idx_messages_channel")
+        await self.conn.execute("DROP INDEX IF EXISTS idx_messages_channel_time")
+
+        await self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_messages_price ON messages(price)
+            WHERE price IS NOT NULL
+            """
+        )
+
+        await self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_messages_urgent ON messages(timestamp)
+            WHERE urgency = 1
+            """
+        )
+
+        await self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_messages_cluster ON messages(cluster_id)
+            WHERE cluster_id IS NOT NULL
+            """
+        )
+
+        await self._init_fts()
+
+        # Keyword/watchlist terms matched by the channel rules, see filters.rules
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS message_tags (
+                tag        TEXT NOT NULL,
+                message_id INTEGER NOT NULL REFERENCES messages(id),
+                PRIMARY KEY (tag, message_id)
+            ) WITHOUT ROWID
+            """
+        )
+
+        await self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_message_tags_message ON message_tags(message_id)
+            """
+        )
+
+        # Resumable history backfill: range of message ids already fetched per channel
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history_checkpoints (
+                channel_username TEXT PRIMARY KEY,
+                min_message_id   INTEGER,
+                max_message_id   INTEGER,
+                updated_at       DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+
+        # Voice transcripts keyed by Telegram file_unique_id or audio hash (LRU)
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcription_cache (
+                cache_key  TEXT PRIMARY KEY,
+                text       TEXT NOT NULL,
+                last_used  REAL NOT NULL,
+                hits       INTEGER DEFAULT 0
+            )
+            """
+        )
+
+        await self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_transcription_cache_last_used
+            ON transcription_cache(last_used)
             """
         )
 
         await self.conn.commit()
         logger.info("Database tables initialized")
 
-    async def add_callback(self, fn) -> None:
+        if self.write_behind:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._writer_task = asyncio.create_task(self._writer_loop())
+            QUEUE_DEPTH.set_function(self._queue.qsize, "db_write")
+            logger.info(
+                f"Write-behind enabled: batch_size={self.batch_size}, "
+                f"flush_interval_ms={self.flush_interval_ms}, queue_size={self.queue_size}"
+            )
+
+    async def _migrate_messages(self) -> None:
+        """Add derived columns missing from databases created by older versions."""
+        cursor = await self.conn.execute("PRAGMA table_info(messages)")
+        existing = {row[1] for row in await cursor.fetchall()}
+        await cursor.close()
+
+        for column, column_type in _DERIVED_COLUMNS.items():
+            if column not in existing:
+                await self.conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+                logger.info(f"Migrated messages table: added column {column}")
+
+    async def _create_channel_id_index(self) -> None:
+        await self.conn.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_channel_id_message
+            ON messages(channel_id, message_id)
+            WHERE source='channel' AND channel_id IS NOT NULL
+            """
+        )
+
+    async def _merge_channel_id_duplicates(self) -> None:
+        """Keep the oldest row per (channel_id, message_id) and delete the rest.
+
+        Tags move to the kept row and near-duplicate clusters are repointed,
+        so nothing refers to a deleted row. Not committed here; init() commits.
+        """
+        await self.conn.execute(
+            """
+            CREATE TEMP TABLE merged_rows AS
+            SELECT m.id AS id, k.keep AS keep
+            FROM messages m JOIN (
+                SELECT channel_id, message_id, MIN(id) AS keep
+                FROM messages
+                WHERE source='channel' AND channel_id IS NOT NULL
+                GROUP BY channel_id, message_id
+                HAVING COUNT(*) > 1
+            ) k ON m.channel_id = k.channel_id AND m.message_id = k.message_id
+            WHERE m.source='channel' AND m.id <> k.keep
+            """
+        )
+        cursor = await self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_tags'"
+        )
+        has_tags = await cursor.fetchone() is not None
+        await cursor.close()
+        if has_tags:
+            await self.conn.execute(
+                """
+                INSERT OR IGNORE INTO message_tags (tag, message_id)
+                SELECT t.tag, r.keep FROM message_tags t JOIN merged_rows r ON t.message_id = r.id
+                """
+            )
+            await self.conn.execute(
+                "DELETE FROM message_tags WHERE message_id IN (SELECT id FROM merged_rows)"
+            )
+        await self.conn.execute(
+            """
+            UPDATE messages SET cluster_id = (
+                SELECT keep FROM merged_rows WHERE id = messages.cluster_id
+            ) WHERE cluster_id IN (SELECT id FROM merged_rows)
+            """
+        )
+        await self.conn.execute("UPDATE messages SET cluster_id = NULL WHERE cluster_id = id")
+        cursor = await self.conn.execute(
+            "DELETE FROM messages WHERE id IN (SELECT id FROM merged_rows)"
+        )
+        logger.warning(f"Removed {cursor.rowcount} duplicate channel messages stored under old usernames")
+        await cursor.close()
+        await self.conn.execute("DROP TABLE merged_rows")
+
+    async def _init_fts(self) -> None:
+        """Create the FTS5 index over message text and transcripts.
+
+        External-content table kept in sync by triggers. It indexes the
+        messages_fts_content view, which folds ё to е like the rest of the
+        pipeline (keyword_index, dedup); unicode61 folds case for Cyrillic
+        but keeps ё distinct. Prefix indexes make "слов*" queries cheap since
+        there is no Russian stemmer.
+        """
+        cursor = await self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='messages_fts'"
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+
+        if row is not None and "messages_fts_content" not in row[0]:
+            # Index built over unfolded text by an older version: recreate it
+            for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+                await self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            await self.conn.execute("DROP TABLE messages_fts")
+            row = None
+
+        await self.conn.execute(
+            f"""
+            CREATE VIEW IF NOT EXISTS messages_fts_content AS
+            SELECT id, {_fold_sql("text")} AS text, {_fold_sql("transcript")} AS transcript
+            FROM messages
+            """
+        )
+
+        await self.conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                text, transcript,
+                content='messages_fts_content', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+            """
+        )
+
+        await self.conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, text, transcript)
+                VALUES (new.id, {_fold_sql("new.text")}, {_fold_sql("new.transcript")});
+            END
+            """
+        )
+
+        await self.conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, text, transcript)
+                VALUES ('delete', old.id, {_fold_sql("old.text")}, {_fold_sql("old.transcript")});
+            END
+            """
+        )
+
+        await self.conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update
+            AFTER UPDATE OF text, transcript ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, text, transcript)
+                VALUES ('delete', old.id, {_fold_sql("old.text")}, {_fold_sql("old.transcript")});
+                INSERT INTO messages_fts(rowid, text, transcript)
+                VALUES (new.id, {_fold_sql("new.text")}, {_fold_sql("new.transcript")});
+            END
+            """
+        )
+
+        if row is None:
+            # Index rows stored before the FTS table existed
+            await self.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            logger.info("Built full-text index for existing messages")
+
+    async def add_callback(
+        self,
+        fn,
+        concurrency: int = 1,
+        queue_size: int = 1000,
+        overflow: str = OVERFLOW_BLOCK,
+        spill_path: Optional[str] = None,
+    ) -> CallbackWorker:
         """Register an async callback invoked after each insert.
 
-        The callback receives (row_id: int, payload: dict).
+        The callback receives (row_id: int, payload: dict). It runs in its own
+        worker tasks fed by a bounded queue, so inserts do not wait for it.
+
+        Args:
+            fn: Async callable
+            concurrency: Number of deliveries to this callback running at once
+            queue_size: Max inserts waiting for this callback
+            overflow: 'block', 'drop-oldest' or 'spill' when the queue is full
+            spill_path: JSON-lines file for the 'spill' policy
+
+        Returns:
+            The worker, whose stats() reports latency, errors and drops
+        """
+        worker = CallbackWorker(fn, concurrency, queue_size, overflow, spill_path)
+        worker.start()
+        QUEUE_DEPTH.set_function(worker.qsize, f"callback:{worker.name}")
+        self._callbacks.append(worker)
+        return worker
+
+    def recent_keys_stats(self) -> dict:
+        """Hit rate and size of the recent-message front cache."""
+        return self.recent_keys.stats() if self.recent_keys is not None else {}
+
+    def callback_stats(self) -> dict:
+        """Delivery stats per registered callback."""
+        return {worker.name: worker.stats() for worker in self._callbacks}
+
+    @staticmethod
+    def _row_values(payload: dict) -> tuple:
+        """Map a message payload to the column values of _INSERT_SQL."""
+        from_user = payload.get("from_user") or {}
+        return (
+            payload.get("source", ""),
+            payload.get("channel_id"),
+            payload.get("channel_username"),
+            payload.get("channel_title"),
+            payload.get("chat_id"),
+            payload.get("message_id"),
+            payload.get("text"),
+            payload.get("timestamp"),
+            from_user.get("id"),
+            from_user.get("username"),
+            from_user.get("first_name"),
+            payload.get("price"),
+            payload.get("urgency"),
+            payload.get("title"),
+            payload.get("transcript"),
+            payload.get("cluster_id"),
+        )
+
+    def _signature(self, payload: dict) -> Optional[bytes]:
+        """Near-duplicate signature, computed before the write lock is taken."""
+        if self.near_duplicates is None:
+            return None
+        return self.near_duplicates.signature(payload.get("text"))
+
+    async def _execute_insert(self, payload: dict, signature: Optional[bytes] = None) -> int:
+        """Execute the insert statement without committing.
+
+        Returns:
+            Row ID of the inserted message (0 if duplicate ignored)
         """
-        self._callbacks.append(fn)
+        chat = None
+        if signature is not None:
+            key = RecentMessageKeys.key(payload)
+            chat = key[:2] if key else None
+            payload["cluster_id"] = self.near_duplicates.find(signature, chat)
+
+        cursor = await self.conn.execute(_INSERT_SQL, self._row_values(payload))
+        # lastrowid keeps the previous value when INSERT OR IGNORE skips the row
+        if cursor.rowcount <= 0:
+            return 0
+        row_id = cursor.lastrowid
+        tags = payload.get("tags")
+        if tags:
+            await self.conn.executemany(_INSERT_TAGS_SQL, [(tag, row_id) for tag in tags])
+        if signature is not None and payload.get("cluster_id") is None:
+            # First message of a new cluster; later near-duplicates point at it
+            self.near_duplicates.add(row_id, signature, chat)
+        return row_id
+
+    async def _insert_transaction(
+        self,
+        payloads: List[dict],
+        checkpoint: Optional[Tuple[str, int, int]] = None,
+        signatures: Optional[List[Optional[bytes]]] = None,
+    ) -> List[int]:
+        """Insert payloads and commit once; roll back everything on failure."""
+        if signatures is None:
+            signatures = [None] * len(payloads)
+        async with self._write_lock:
+            row_ids = []
+            try:
+                # executemany() cannot report per-row ids, so rows are inserted
+                # one by one; the saving comes from the single commit.
+                for payload, signature in zip(payloads, signatures):
+                    row_ids.append(await self._execute_insert(payload, signature))
+                if checkpoint is not None:
+                    await self._upsert_checkpoint(*checkpoint)
+                await self.conn.commit()
+            except Exception:
+                try:
+                    await self.conn.rollback()
+                except Exception as rollback_error:
+                    logger.warning(f"Rollback failed: {rollback_error}")
+                if self.near_duplicates is not None:
+                    # Rolled-back row ids are handed out again
+                    self.near_duplicates.discard(row_ids)
+                raise
+            if self.recent_keys is not None:
+                self.recent_keys.add(payloads)
+        COMMIT_BATCH_SIZE.observe(len(payloads))
+        if self.notifier is not None and any(row_ids):
+            self.notifier.notify(max(row_ids))
+        return row_ids
+
+    async def _after_insert(self, row_id: int, payload: dict) -> None:
+        """Log the outcome of an insert and notify callbacks for new rows."""
+        source = payload.get("source", "")
+        message_id = payload.get("message_id")
+        if row_id:
+            logger.debug(f"Inserted message {row_id}: {source} message_id={message_id}")
+            MESSAGES_INSERTED.inc(source, channel_label(payload))
+            if payload.get("cluster_id"):
+                MESSAGES_NEAR_DUPLICATE.inc(source, channel_label(payload))
+            for worker in self._callbacks:
+                try:
+                    await worker.submit(row_id, payload)
+                except Exception as e:
+                    # The row is committed; a failing callback must not fail the insert
+                    logger.error(f"Callback {worker.name} submit error for row {row_id}: {e}")
+        else:
+            logger.debug(f"Duplicate skipped: {source} message_id={message_id}")
+            MESSAGES_DUPLICATE.inc(source, channel_label(payload))
 
     async def insert_message(self, payload: dict) -> int:
         """Insert a message into the database (duplicates are silently ignored).
 
+        In write-behind mode the payload is queued and the call resolves once
+        the batch containing it has been committed.
+
         Args:
             payload: Dictionary with message data including 'source' field
 
         Returns:
             Row ID of inserted or existing message (0 if duplicate ignored)
         """
+        return await (await self.submit_message(payload))
+
+    async def submit_message(self, payload: dict) -> "asyncio.Future[int]":
+        """Queue an insert and return a future for its row id.
+
+        In write-behind mode this returns as soon as the payload is queued
+        (waiting only while the queue is full), so a caller that needs
+        ordering but not the row id, like an ingestion lane, can move on to
+        the next message while the batch commits. Messages submitted one
+        after another are committed in that order. Without write-behind the
+        insert is done before returning.
+        """
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        if self.recent_keys is not None and self.recent_keys.seen(payload):
+            INSERT_LATENCY.observe(time.monotonic() - started)
+            await self._after_insert(0, payload)
+            future = loop.create_future()
+            future.set_result(0)
+            return future
+
+        signature = self._signature(payload)
+        if self._writer_task is not None:
+            future = loop.create_future()
+            future.add_done_callback(lambda f: self._insert_done(f, started))
+            await self._queue.put((payload, signature, future))
+            return future
+
+        future = loop.create_future()
+        future.set_result(await self._insert_one(payload, signature, started))
+        return future
+
+    @staticmethod
+    def _insert_done(future: asyncio.Future, started: float) -> None:
+        if future.cancelled():
+            return
+        # Marks the error as retrieved: _flush_batch has logged it, and
+        # fire-and-forget callers need not await the future
+        if future.exception() is None:
+            INSERT_LATENCY.observe(time.monotonic() - started)
+
+    async def _insert_one(self, payload: dict, signature: Optional[bytes], started: float) -> int:
+        """Insert a single message in its own transaction (no write-behind)."""
+        try:
+            (row_id,) = await self._insert_transaction([payload], signatures=[signature])
+        except Exception as e:
+            logger.error(f"Error inserting message: {e}")
+            raise
+        INSERT_LATENCY.observe(time.monotonic() - started)
+        await self._after_insert(row_id, payload)
+        return row_id
+
+    async def insert_messages(
+        self,
+        payloads: List[dict],
+        checkpoint: Optional[Tuple[str, int, int]] = None,
+    ) -> List[int]:
+        """Insert many messages in a single transaction.
+
+        Args:
+            payloads: Message payloads, same format as insert_message
+            checkpoint: Optional (channel_username, min_message_id, max_message_id)
+                merged into history_checkpoints in the same transaction
+
+        Returns:
+            Row IDs in payload order (0 for each duplicate ignored)
+        """
+        if self.recent_keys is not None:
+            known = [self.recent_keys.seen(payload) for payload in payloads]
+            pending = [payload for payload, seen in zip(payloads, known) if not seen]
+        else:
+            known = [False] * len(payloads)
+            pending = payloads
+
         try:
-            source = payload.get("source", "")
-            channel_id = payload.get("channel_id")
-            channel_username = payload.get("channel_username")
-            channel_title = payload.get("channel_title")
-            chat_id = payload.get("chat_id")
-            message_id = payload.get("message_id")
-            text = payload.get("text")
-            timestamp = payload.get("timestamp")
-
-            from_user = payload.get("from_user") or {}
-            from_user_id = from_user.get("id")
-            from_username = from_user.get("username")
-            from_first_name = from_user.get("first_name")
+            if pending or checkpoint is not None:
+                signatures = [self._signature(payload) for payload in pending]
+                inserted = await self._insert_transaction(pending, checkpoint, signatures)
+            else:
+                inserted = []
+        except Exception as e:
+            logger.error(f"Error inserting {len(pending)} messages: {e}")
+            raise
 
+        # Known duplicates were never sent to the database
+        inserted_ids = iter(inserted)
+        row_ids = [0 if seen else next(inserted_ids) for seen in known]
+        for payload, row_id in zip(payloads, row_ids):
+            await self._after_insert(row_id, payload)
+        return row_ids
+
+    async def set_transcript(self, payload: dict, transcript: str) -> bool:
+        """Attach a transcript to a message that is already stored.
+
+        Fields the channel rules extracted from the transcript (price,
+        urgency, title and tags present in the payload) are written in the
+        same transaction, so they are not lost when the row was stored first.
+
+        Args:
+            payload: Message payload identifying the row (source, chat and message_id)
+            transcript: Recognized text of the voice message
+
+        Returns:
+            True if a stored message was updated
+        """
+        if payload.get("source") == "channel":
+            where = "source = 'channel' AND channel_id = ? AND message_id = ?"
+            key = (payload.get("channel_id"), payload.get("message_id"))
+        else:
+            where = "source = 'private' AND chat_id = ? AND message_id = ?"
+            key = (payload.get("chat_id"), payload.get("message_id"))
+
+        columns = ["transcript"] + [c for c in ("price", "urgency", "title") if c in payload]
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        values = [transcript] + [payload[column] for column in columns[1:]]
+
+        async with self._write_lock:
+            try:
+                cursor = await self.conn.execute(f"SELECT id FROM messages WHERE {where}", key)
+                row = await cursor.fetchone()
+                await cursor.close()
+                if row is None:
+                    return False
+                row_id = row[0]
+                await self.conn.execute(
+                    f"UPDATE messages SET {assignments} WHERE id = ?",
+                    (*values, row_id),
+                )
+                tags = payload.get("tags")
+                if tags:
+                    await self.conn.executemany(_INSERT_TAGS_SQL, [(tag, row_id) for tag in tags])
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+        return True
+
+    async def get_history_checkpoint(self, channel_username: str) -> Optional[Tuple[int, int]]:
+        """Return (min_message_id, max_message_id) already fetched for a channel."""
+        cursor = await self.conn.execute(
+            """
+            SELECT min_message_id, max_message_id
+            FROM history_checkpoints WHERE channel_username = ?
+            """,
+            (channel_username,),
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        return (row[0], row[1]) if row else None
+
+    async def save_history_checkpoint(
+        self, channel_username: str, min_message_id: int, max_message_id: int
+    ) -> None:
+        """Extend the fetched message id range recorded for a channel."""
+        async with self._write_lock:
+            await self._upsert_checkpoint(channel_username, min_message_id, max_message_id)
+            await self.conn.commit()
+
+    async def get_cached_transcription(self, cache_key: str) -> Optional[str]:
+        """Return a cached transcript and mark it as recently used."""
+        async with self._write_lock:
             cursor = await self.conn.execute(
                 """
-                INSERT OR IGNORE INTO messages (
-                    source, channel_id, channel_username, channel_title,
-                    chat_id, message_id, text, timestamp,
-                    from_user_id, from_username, from_first_name
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                UPDATE transcription_cache
+                SET last_used = ?, hits = hits + 1
+                WHERE cache_key = ?
+                RETURNING text
                 """,
-                (
-                    source,
-                    channel_id,
-                    channel_username,
-                    channel_title,
-                    chat_id,
-                    message_id,
-                    text,
-                    timestamp,
-                    from_user_id,
-                    from_username,
-                    from_first_name,
-                ),
+                (time.time(), cache_key),
             )
+            row = await cursor.fetchone()
+            await cursor.close()
             await self.conn.commit()
-            row_id = cursor.lastrowid or 0
-            if row_id:
-                logger.debug(f"Inserted message {row_id}: {source} message_id={message_id}")
-                for cb in self._callbacks:
-                    try:
-                        await cb(row_id, payload)
-                    except Exception as e:
-                        logger.error(f"Callback error: {e}")
-            else:
-                logger.debug(f"Duplicate skipped: {source} message_id={message_id}")
-            return row_id
+        return row[0] if row else None
+
+    async def cache_transcription(self, cache_keys: List[str], text: str) -> None:
+        """Store a transcript under every key and evict least recently used entries."""
+        now = time.time()
+        async with self._write_lock:
+            await self.conn.executemany(
+                """
+                INSERT INTO transcription_cache (cache_key, text, last_used)
+                VALUES (?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    text = excluded.text, last_used = excluded.last_used
+                """,
+                [(key, text, now) for key in cache_keys],
+            )
+            await self.conn.execute(
+                """
+                DELETE FROM transcription_cache WHERE cache_key IN (
+                    SELECT cache_key FROM transcription_cache
+                    ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.transcription_cache_size,),
+            )
+            await self.conn.commit()
+
+    async def _upsert_checkpoint(
+        self, channel_username: str, min_message_id: int, max_message_id: int
+    ) -> None:
+        """Merge a fetched id range into history_checkpoints without committing."""
+        await self.conn.execute(
+            """
+            INSERT INTO history_checkpoints (channel_username, min_message_id, max_message_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(channel_username) DO UPDATE SET
+                min_message_id = MIN(COALESCE(min_message_id, excluded.min_message_id),
+                                     excluded.min_message_id),
+                max_message_id = MAX(COALESCE(max_message_id, excluded.max_message_id),
+                                     excluded.max_message_id),
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (channel_username, min_message_id, max_message_id),
+        )
+
+    async def _writer_loop(self) -> None:
+        """Collect queued inserts into batches and commit each batch once."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            # Commit as soon as the queue runs dry: callers await their rows,
+            # so waiting for more would only delay them. Rows queued while this
+            # commit runs form the next batch. The deadline only bounds how long
+            # a steady stream of ready producers may keep growing the batch.
+            batch = [item]
+            deadline = loop.time() + self.flush_interval_ms / 1000
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    if loop.time() >= deadline:
+                        break
+                    # Let handlers that are ready to enqueue run once
+                    await asyncio.sleep(0)
+                    if self._queue.empty():
+                        break
+                    continue
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await self._flush_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush_batch(self, batch: list) -> None:
+        """Write a batch of (payload, signature, future) items in a single transaction.
+
+        If the group commit fails, the rows are retried one per transaction,
+        so a single bad payload fails only its own future.
+        """
+        try:
+            results = await self._insert_transaction(
+                [payload for payload, _, _ in batch],
+                signatures=[signature for _, signature, _ in batch],
+            )
+            logger.debug(f"Committed batch of {len(batch)} messages")
         except Exception as e:
-            logger.error(f"Error inserting message: {e}")
-            raise
+            if len(batch) == 1:
+                results = [e]
+            else:
+                logger.warning(f"Batch of {len(batch)} messages failed ({e}), retrying one by one")
+                results = []
+                for payload, signature, _ in batch:
+                    try:
+                        (row_id,) = await self._insert_transaction([payload], signatures=[signature])
+                        results.append(row_id)
+                    except Exception as row_error:
+                        results.append(row_error)
+
+        # Resolve every caller first; callback fan-out may wait on full queues
+        for (payload, _, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Error inserting {payload.get('source', '')} "
+                    f"message_id={payload.get('message_id')}: {result}"
+                )
+                if not future.done():
+                    future.set_exception(result)
+            elif not future.done():
+                future.set_result(result)
+        for (payload, _, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                continue
+            try:
+                await self._after_insert(result, payload)
+            except Exception as e:
+                logger.error(f"Error after inserting row {result}: {e}")
+
+    async def drain(self) -> None:
+        """Wait until every queued insert has been committed."""
+        if self._writer_task is not None:
+            await self._queue.join()
 
     async def close(self) -> None:
-        """Close database connection."""
+        """Flush pending inserts and close database connection."""
+        if self._writer_task is not None:
+            await self._queue.put(_STOP)
+            await self._writer_task
+            self._writer_task = None
+        for worker in self._callbacks:
+            await worker.close()
         if self.conn:
             await self.conn.close()
             logger.info("Database connection closed")
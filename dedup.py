@@ -0,0 +1,196 @@
+"""Near-duplicate detection for cross-posted messages.
+
+Each message text gets a MinHash signature over word bigrams: ``num_perm``
+16-bit values whose fraction of equal positions estimates the Jaccard
+similarity of two texts. Reposts that differ only in a channel signature,
+a link or a changed number stay well above the threshold, while different
+posts on the same topic stay far below it.
+
+Recent signatures are kept in an in-memory LSH index: the signature is cut
+into bands, and texts sharing any whole band become candidates, so a lookup
+compares a handful of entries instead of every recent message. Only cluster
+representatives (the first message of each cluster) are indexed; entries
+expire after ``window`` seconds and the oldest are dropped once
+``max_entries`` is reached, so memory stays bounded.
+"""
+
+import hashlib
+import logging
+import re
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("parser.dedup")
+
+_WORD_RE = re.compile(r"\w+")
+# blake2b digest size: 32 independent 16-bit hash values per call
+_DIGEST_SIZE = 64
+# Width of one hash value; 16 bits make chance collisions of minima negligible
+_TYPECODE = "H"
+_VALUE_SIZE = 2
+
+
+def shingles(text: str, size: int = 2) -> List[str]:
+    """Word n-grams of the case-folded text (ё = е), without duplicates."""
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return list({" ".join(gram) for gram in zip(*(words[i:] for i in range(size)))})
+
+
+class MinHasher:
+    """MinHash signatures from ``num_perm`` independent 16-bit hash functions.
+
+    The hash values of a feature are slices of keyed blake2b digests (stable
+    across processes, unlike hash()), and the per-function minimum is taken
+    column-wise by min() over zip(), so the Python-level work is one digest
+    call per feature (for up to 32 functions) instead of one per function.
+    """
+
+    def __init__(self, num_perm: int = 32):
+        self.num_perm = num_perm
+        self.size = num_perm * _VALUE_SIZE
+        blocks = -(-self.size // _DIGEST_SIZE)
+        # Keyed once; copy() per feature skips re-keying
+        self._hashers = [
+            hashlib.blake2b(digest_size=_DIGEST_SIZE, key=f"minhash{i}".encode())
+            for i in range(blocks)
+        ]
+
+    def _digest(self, data: bytes) -> bytes:
+        parts = []
+        for hasher in self._hashers:
+            h = hasher.copy()
+            h.update(data)
+            parts.append(h.digest())
+        return b"".join(parts)
+
+    def signature(self, features: Iterable[str]) -> bytes:
+        size = self.size
+        rows = [array(_TYPECODE, self._digest(f.encode("utf-8"))[:size]) for f in features]
+        return array(_TYPECODE, map(min, zip(*rows))).tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures (0.0 if either is empty)."""
+    first, second = array(_TYPECODE, a), array(_TYPECODE, b)
+    if not first or not second:
+        return 0.0
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """Recent MinHash signatures with banded LSH lookup and time-based eviction.
+
+    Each entry remembers the chat it came from, and candidates from the same
+    chat are skipped: a channel's own template posts are not cross-posts.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        window: float = 24 * 3600,
+        max_entries: int = 20_000,
+        min_words: int = 8,
+        num_perm: int = 32,
+        bands: int = 8,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.min_words = min_words
+        self.hasher = MinHasher(num_perm)
+
+        # Byte ranges of the bands; with 8 bands of 4 rows a pair at
+        # similarity 0.7 becomes a candidate with ~90% probability, at 0.8 ~98%
+        width = num_perm // bands * _VALUE_SIZE
+        self._bands: List[Tuple[int, int]] = [(i * width, (i + 1) * width) for i in range(bands)]
+        # Per band: band bytes -> cluster ids sharing them
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        # cluster id -> (added at, signature, chat), oldest first
+        self._entries: "OrderedDict[int, Tuple[float, bytes, Hashable]]" = OrderedDict()
+
+        self.lookups = 0
+        self.matches = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: Optional[str]) -> Optional[bytes]:
+        """Signature of a message text, None for texts too short to compare.
+
+        Short texts ("ok", "+1", a bare link) overlap by chance too easily,
+        so they are never clustered. Texts without words (punctuation,
+        emoji) have no shingles and no signature.
+        """
+        if not text or len(_WORD_RE.findall(text)) < self.min_words:
+            return None
+        features = shingles(text)
+        if not features:
+            return None
+        return self.hasher.signature(features)
+
+    def _evict(self, now: float) -> None:
+        entries = self._entries
+        while entries:
+            cluster_id, (added_at, _, _) = next(iter(entries.items()))
+            if len(entries) <= self.max_entries and now - added_at <= self.window:
+                break
+            self._remove(cluster_id)
+
+    def _remove(self, cluster_id: int) -> None:
+        _, signature, _ = self._entries.pop(cluster_id)
+        for buckets, (start, end) in zip(self._buckets, self._bands):
+            key = signature[start:end]
+            members = buckets.get(key)
+            if members is not None:
+                members.remove(cluster_id)
+                if not members:
+                    del buckets[key]
+
+    def find(self, signature: bytes, chat: Hashable = None) -> Optional[int]:
+        """Cluster id of the most similar recent message from another chat."""
+        self._evict(time.monotonic())
+        self.lookups += 1
+        candidates = set()
+        for buckets, (start, end) in zip(self._buckets, self._bands):
+            candidates.update(buckets.get(signature[start:end], ()))
+
+        best_id, best_score = None, self.threshold
+        for cluster_id in candidates:
+            _, candidate, candidate_chat = self._entries[cluster_id]
+            if chat is not None and candidate_chat == chat:
+                continue
+            score = similarity(signature, candidate)
+            if score >= best_score:
+                best_id, best_score = cluster_id, score
+        if best_id is not None:
+            self.matches += 1
+        return best_id
+
+    def add(self, cluster_id: int, signature: bytes, chat: Hashable = None) -> None:
+        """Index a new cluster representative."""
+        if cluster_id in self._entries:
+            self._remove(cluster_id)
+        now = time.monotonic()
+        self._entries[cluster_id] = (now, signature, chat)
+        for buckets, (start, end) in zip(self._buckets, self._bands):
+            buckets.setdefault(signature[start:end], []).append(cluster_id)
+        self._evict(now)
+
+    def discard(self, cluster_ids: Iterable[int]) -> None:
+        """Forget clusters whose rows were rolled back (their ids may be reused)."""
+        for cluster_id in cluster_ids:
+            if cluster_id in self._entries:
+                self._remove(cluster_id)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "matches": self.matches,
+        }
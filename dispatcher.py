@@ -0,0 +1,74 @@
+"""Sharded ingestion dispatcher.
+
+Incoming messages are routed to one of N worker lanes by chat id. Each lane
+is a bounded queue drained by a single task, so messages from one chat are
+handled strictly in arrival order while different chats proceed in
+parallel. When a lane is full, submit() waits, which pushes back on the
+Pyrogram update loop instead of growing memory without bound.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger("parser.dispatcher")
+
+
+class IngestDispatcher:
+    """Runs handler coroutines on per-chat ordered lanes."""
+
+    def __init__(self, lanes: int = 4, queue_size: int = 1000):
+        self.lane_count = max(1, lanes)
+        self.queue_size = max(1, queue_size)
+        self._lanes: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        """Create the lanes and their workers (requires a running event loop)."""
+        for index in range(self.lane_count):
+            lane = asyncio.Queue(maxsize=self.queue_size)
+            self._lanes.append(lane)
+            self._tasks.append(asyncio.create_task(self._worker(index, lane)))
+            QUEUE_DEPTH.set_function(lane.qsize, f"lane:{index}")
+        logger.info(f"Ingestion dispatcher: {self.lane_count} lanes, queue_size={self.queue_size}")
+
+    def lane_for(self, chat_id: Optional[int]) -> int:
+        """Lane index for a chat; messages without a chat share lane 0."""
+        return (chat_id or 0) % self.lane_count
+
+    async def submit(self, chat_id: Optional[int], handler, *args) -> None:
+        """Queue handler(*args) on the chat's lane, waiting while the lane is full."""
+        await self._lanes[self.lane_for(chat_id)].put((handler, args))
+
+    async def _worker(self, index: int, lane: asyncio.Queue) -> None:
+        while True:
+            handler, args = await lane.get()
+            try:
+                await handler(*args)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Lane {index} handler {getattr(handler, '__name__', handler)} failed: {e}")
+            finally:
+                lane.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth per lane and totals."""
+        return {
+            "queued": [lane.qsize() for lane in self._lanes],
+            "processed": self.processed,
+            "errors": self.errors,
+        }
+
+    async def close(self) -> None:
+        """Finish everything already queued, then stop the workers."""
+        for lane in self._lanes:
+            await lane.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,134 @@
+"""
+Индекс ключевых слов на автомате Ахо–Корасик
+Находит все вхождения тысяч терминов за один линейный проход по тексту.
+
+Сравнение без учёта регистра, «ё» приравнивается к «е». Термин с «*» на
+конце совпадает как префикс слова («парсинг*» находит «парсингом»), в
+режиме word_boundary остальные термины совпадают только целым словом.
+
+При установленном pyahocorasick автомат строится им (на C), иначе
+используется реализация на чистом Python с тем же результатом.
+"""
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # необязательная зависимость
+    ahocorasick = None
+
+
+class KeywordMatch(NamedTuple):
+    """Вхождение термина: позиции в исходном тексте, end не включается
+
+    term — термин в нормализованном виде (нижний регистр, «е» вместо «ё»,
+    без «*»), одинаковый для всех написаний.
+    """
+
+    term: str
+    start: int
+    end: int
+
+
+def fold(text: str) -> str:
+    """Нормализует регистр, сохраняя длину строки (позиции совпадают с исходными)"""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # Редкие символы (например, «İ») при lower() превращаются в два
+        folded = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    return folded.replace("ё", "е")
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+class _Automaton:
+    """Автомат Ахо–Корасик на чистом Python"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+
+        for pattern in patterns:
+            state = 0
+            for c in pattern:
+                nxt = self._goto[state].get(c)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][c] = nxt
+                state = nxt
+            self._out[state] += (pattern,)
+
+        # Ссылки неудач в порядке обхода в ширину
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(c, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def iter(self, text: str):
+        """Пары (индекс последнего символа, образец)"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, c in enumerate(text):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for pattern in out[state]:
+                yield i, pattern
+
+
+class KeywordIndex:
+    """Поиск всех терминов списка за один проход по тексту"""
+
+    def __init__(self, terms: Iterable[str], word_boundary: bool = True):
+        self.word_boundary = word_boundary
+        # нормализованный термин -> совпадать ли как префикс слова
+        self._terms: Dict[str, bool] = {}
+        for term in terms:
+            pattern = fold(term.rstrip("*").strip())
+            if pattern:
+                self._terms[pattern] = self._terms.get(pattern, False) or term.endswith("*")
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for pattern in self._terms:
+                self._automaton.add_word(pattern, pattern)
+            if self._terms:
+                self._automaton.make_automaton()
+        else:
+            self._automaton = _Automaton(self._terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """Все вхождения терминов (в том числе перекрывающиеся) по порядку конца"""
+        if not self._terms:
+            return []
+        folded = fold(text)
+        matches = []
+        for end_index, pattern in self._automaton.iter(folded):
+            end = end_index + 1
+            start = end - len(pattern)
+            if self.word_boundary:
+                if start > 0 and _is_word_char(folded[start - 1]):
+                    continue
+                if not self._terms[pattern] and end < len(folded) and _is_word_char(folded[end]):
+                    continue
+            matches.append(KeywordMatch(pattern, start, end))
+        return matches
+
+    def terms(self, text: str) -> List[str]:
+        """Найденные термины без повторов, в порядке первого вхождения"""
+        return list(dict.fromkeys(match.term for match in self.find(text)))
@@ -0,0 +1,214 @@
+"""
+Декларативные правила фильтрации по каналам
+Правила читаются из JSON-файла, компилируются один раз и перечитываются
+при изменении файла без перезапуска парсера.
+
+Формат файла (все поля необязательны):
+
+{
+  "default": {"extract": ["title", "price", "urgency"]},
+  "channels": {
+    "kworkMarket_bot": {
+      "keywords": ["python", "bot", "парсинг"],
+      "exclude_keywords": ["wordpress"],
+      "watchlist": ["django", "fastapi", "парсинг*"],
+      "word_boundary": true,
+      "regex": ["телеграм.?бот"],
+      "min_price": 1000,
+      "max_price": 500000,
+      "urgency_keywords": ["срочно", "сегодня"],
+      "extract": ["title", "price", "urgency"]
+    }
+  }
+}
+
+Каналы без своего набора правил используют "default"; без файла
+принимается всё, как раньше с UniversalFilter.
+
+Ключевые слова ищутся одним проходом автомата Ахо–Корасик (см.
+filters.keyword_index). Найденные keywords и термины watchlist
+сохраняются вместе с сообщением как теги (таблица message_tags).
+По умолчанию термины ищутся как подстроки; с "word_boundary": true —
+только целыми словами, а «*» на конце термина разрешает окончания.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Optional
+
+from filters.keyword_index import KeywordIndex, fold
+from filters.universal_filter import UniversalFilter
+
+logger = logging.getLogger("parser.rules")
+
+EXTRACT_FIELDS = ("title", "price", "urgency")
+
+_RULE_KEYS = {
+    "keywords", "exclude_keywords", "watchlist", "word_boundary", "regex",
+    "min_price", "max_price", "urgency_keywords", "title_emoji", "extract",
+}
+
+
+def normalize_channel(username: str) -> str:
+    """Ключ канала: без @ и в нижнем регистре (username в Telegram регистронезависим)"""
+    return username.lstrip("@").lower()
+
+
+class RuleSet:
+    """Скомпилированный набор правил одного канала"""
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        unknown = set(spec) - _RULE_KEYS
+        if unknown:
+            raise ValueError(f"{name}: неизвестные поля {sorted(unknown)}")
+
+        self.name = name
+        keywords = spec.get("keywords", ())
+        exclude_keywords = spec.get("exclude_keywords", ())
+        watchlist = spec.get("watchlist", ())
+        # Нормализованные термины каждого вида; ищутся одним автоматом
+        self.keywords = frozenset(fold(kw.rstrip("*").strip()) for kw in keywords)
+        self.exclude_keywords = frozenset(fold(kw.rstrip("*").strip()) for kw in exclude_keywords)
+        terms = [*keywords, *exclude_keywords, *watchlist]
+        self.index = (
+            KeywordIndex(terms, word_boundary=spec.get("word_boundary", False)) if terms else None
+        )
+        self.patterns = tuple(
+            re.compile(pattern, re.IGNORECASE) for pattern in spec.get("regex", ())
+        )
+        self.min_price = spec.get("min_price")
+        self.max_price = spec.get("max_price")
+
+        self.extract = tuple(spec.get("extract", EXTRACT_FIELDS))
+        unknown = set(self.extract) - set(EXTRACT_FIELDS)
+        if unknown:
+            raise ValueError(f"{name}: неизвестные поля extract {sorted(unknown)}")
+
+        self.extractor = UniversalFilter(
+            urgency_keywords=spec.get("urgency_keywords"),
+            title_emoji=spec.get("title_emoji"),
+        )
+        self._needs_price = (
+            "price" in self.extract or self.min_price is not None or self.max_price is not None
+        )
+
+    def match(self, text: str) -> Optional[Dict[str, Any]]:
+        """Проверяет сообщение и извлекает поля
+
+        Returns:
+            Словарь извлечённых полей или None, если сообщение отфильтровано
+        """
+        found = self.index.terms(text) if self.index is not None else []
+        if self.keywords and self.keywords.isdisjoint(found):
+            return None
+        if self.exclude_keywords and not self.exclude_keywords.isdisjoint(found):
+            return None
+        if self.patterns and not any(p.search(text) for p in self.patterns):
+            return None
+
+        text_lower = text.lower()
+        info: Dict[str, Any] = {}
+        if self._needs_price:
+            price = self.extractor.price_from_lower(text_lower)
+            # Как в KworkFilter: сообщения без цены не отсекаются
+            if price and self.min_price is not None and price < self.min_price:
+                return None
+            if price and self.max_price is not None and price > self.max_price:
+                return None
+            if "price" in self.extract:
+                info["price"] = price
+        if "title" in self.extract:
+            info["title"] = self.extractor.extract_title(text)
+        if "urgency" in self.extract:
+            info["urgency"] = self.extractor.extract_urgency(text_lower)
+        if found:
+            info["tags"] = found
+        return info
+
+
+class RuleEngine:
+    """Правила по каналам с горячей перезагрузкой файла"""
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.default = RuleSet("default", {})
+        self.channels: Dict[str, RuleSet] = {}
+        self._mtime: Optional[float] = None
+
+    def for_channel(self, username: str) -> RuleSet:
+        """Набор правил канала (O(1) по словарю)"""
+        return self.channels.get(normalize_channel(username), self.default)
+
+    def match(self, username: str, text: str) -> Optional[Dict[str, Any]]:
+        """Применяет правила канала к тексту"""
+        return self.for_channel(username).match(text)
+
+    @staticmethod
+    def compile(data: Dict[str, Any]):
+        """Компилирует содержимое файла в (default, {канал: RuleSet})"""
+        default = RuleSet("default", data.get("default", {}))
+        channels = {
+            normalize_channel(username): RuleSet(username, spec)
+            for username, spec in data.get("channels", {}).items()
+        }
+        return default, channels
+
+    def _read(self, path: str):
+        mtime = os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return mtime, self.compile(data)
+
+    def load(self, path: str) -> bool:
+        """Загружает правила из файла; без файла принимается всё
+
+        Returns:
+            True, если правила загружены из файла
+        """
+        self.path = path
+        if not os.path.exists(path):
+            logger.info(f"Файл правил {path} не найден, сообщения не фильтруются")
+            return False
+        self._mtime, (self.default, self.channels) = self._read(path)
+        logger.info(f"Загружены правила для {len(self.channels)} каналов из {path}")
+        return True
+
+    async def reload_if_changed(self) -> bool:
+        """Перечитывает файл, если он изменился
+
+        Новые правила компилируются в отдельном потоке и подменяют старые
+        одним присваиванием: сообщения в обработке доходят по старым
+        правилам, следующие идут по новым. При ошибке в файле остаются
+        прежние правила.
+        """
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            mtime, (default, channels) = await asyncio.to_thread(self._read, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка в файле правил {self.path}, оставлены прежние: {e}")
+            self._mtime = mtime
+            return False
+
+        self.default, self.channels, self._mtime = default, channels, mtime
+        logger.info(f"Правила перезагружены: {len(channels)} каналов")
+        return True
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Проверяет файл правил каждые interval секунд"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
+
+
+# Глобальный экземпляр
+rule_engine = RuleEngine()
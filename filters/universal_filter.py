@@ -2,63 +2,85 @@
 Универсальный фильтр для всех заказов
 Собирает всё, без фильтрации по ключевым словам
 """
+import re
 from typing import Dict, Any
 from datetime import datetime
 
 class UniversalFilter:
     """Фильтр для сбора всех заказов"""
-    
+
     # Минимальная цена для сбора (можно 0 = всё)
     MIN_PRICE = 0
-    
-    def __init__(self):
-        self.price_pattern = None
-    
-    def extract_price(self, text: str) -> int:
-        """Извлекает минимальную цену из текста"""
-        import re
-        
-        # Поиск "от 2000₽"
-        match = re.search(r'от\s+([\d]+)₽', text, re.IGNORECASE)
+
+    # Ключевые слова срочности (в нижнем регистре)
+    URGENCY_KEYWORDS = ("срочно", "сегодня", "urgent", "fast", "🔥")
+
+    # Эмодзи, вырезаемые из заголовка
+    TITLE_EMOJI = "🔥💰⏰📝🔗"
+
+    def __init__(self, urgency_keywords=None, title_emoji=None):
+        if urgency_keywords is not None:
+            self.URGENCY_KEYWORDS = tuple(kw.lower() for kw in urgency_keywords)
+        if title_emoji is not None:
+            self.TITLE_EMOJI = title_emoji
+
+        # Паттерны компилируются один раз и применяются к тексту в нижнем
+        # регистре, поэтому re.IGNORECASE не нужен
+        self.price_min_pattern = re.compile(r'от\s+(\d+)₽')
+        self.price_range_pattern = re.compile(r'(\d+)\s*-\s*\d+₽')
+        self.title_table = str.maketrans("", "", self.TITLE_EMOJI)
+
+    def price_from_lower(self, text_lower: str) -> int:
+        """Цена из текста в нижнем регистре (0 = не найдена)"""
+        # Обе формы цены заканчиваются на ₽: без него regex не запускаем
+        if '₽' not in text_lower:
+            return 0
+
+        # Поиск "от 2000₽" (приоритетнее диапазона, даже если он раньше в тексте)
+        match = self.price_min_pattern.search(text_lower)
         if match:
             return int(match.group(1))
-        
+
         # Поиск "2000-5000₽"
-        match = re.search(r'([\d]+)\s*-\s*([\d]+)₽', text, re.IGNORECASE)
+        match = self.price_range_pattern.search(text_lower)
         if match:
             return int(match.group(1))
-        
+
         return 0
-    
+
+    def extract_price(self, text: str) -> int:
+        """Извлекает минимальную цену из текста"""
+        return self.price_from_lower(text.lower())
+
     def is_relevant(self, text: str) -> bool:
         """Принимает ВСЁ (фильтр отключён)"""
         return True
-    
+
+    def extract_title(self, text: str) -> str:
+        """Заголовок: первая строка без эмодзи"""
+        first_line = text.lstrip().partition('\n')[0]
+        return first_line.translate(self.title_table).strip()[:100]
+
+    def extract_urgency(self, text_lower: str) -> bool:
+        """Есть ли в тексте (в нижнем регистре) слова срочности"""
+        return any(kw in text_lower for kw in self.URGENCY_KEYWORDS)
+
     def extract_info(self, text: str) -> Dict[str, Any]:
-        """Извлекает информацию из сообщения"""
-        import re
-        
-        # Извлекаем заголовок (первая строка без эмодзи)
-        lines = text.strip().split('\n')
-        title = ""
-        if lines:
-            title = re.sub(r'[🔥💰⏰📝🔗]', '', lines[0]).strip()
-        
-        # Извлекаем цену
-        price = self.extract_price(text)
-        
-        # Проверяем срочность
-        urgency_keywords = ["срочно", "сегодня", "urgent", "fast", "🔥"]
-        urgency = any(kw in text.lower() for kw in urgency_keywords)
-        
+        """Извлекает информацию из сообщения
+
+        Текст переводится в нижний регистр один раз; цена и срочность
+        ищутся по нему, заголовок берётся только из первой строки.
+        """
+        text_lower = text.lower()
+
         info = {
-            "title": title[:100],
-            "price": price,
-            "urgency": urgency,
+            "title": self.extract_title(text),
+            "price": self.price_from_lower(text_lower),
+            "urgency": self.extract_urgency(text_lower),
             "timestamp": datetime.now(),
             "full_text": text[:2000]  # Полный текст для дальнейшего анализа
         }
-        
+
         return info
 
 
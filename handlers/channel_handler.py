@@ -1,5 +1,6 @@
 import logging
-from filters.universal_filter import universal_filter
+from filters.rules import rule_engine
+from metrics import MESSAGES_FILTERED
 
 logger = logging.getLogger("parser.handler.channel")
 
@@ -7,14 +8,18 @@ logger = logging.getLogger("parser.handler.channel")
 async def handle_channel_message(client, message, db, registry):
     """Handle messages from Telegram channels."""
     try:
-        # Check if channel is active
-        if not message.chat or not message.chat.username:
-            logger.debug("Skipping message with no channel username")
+        chat = message.chat
+        if not chat:
+            logger.debug("Skipping message with no chat")
+            MESSAGES_FILTERED.inc("channel", "", "no_chat")
             return
 
-        channel_username = message.chat.username
-        if not registry.is_active(channel_username):
-            logger.debug(f"Channel {channel_username} not active, skipping message")
+        # Private channels have no username; they are tracked by id
+        channel_username = chat.username
+        channel_key = channel_username or str(chat.id)
+        if not registry.is_active_chat(chat):
+            logger.debug(f"Channel {channel_key} not active, skipping message")
+            MESSAGES_FILTERED.inc("channel", channel_key, "inactive")
             return
 
         # Extract message data
@@ -26,30 +31,32 @@ async def handle_channel_message(client, message, db, registry):
             "first_name": from_user.first_name if from_user else None,
         } if from_user else None
 
-        # Проверяем фильтр (теперь принимает ВСЁ)
-        if not universal_filter.is_relevant(text):
-            logger.debug(f"Message filtered out: {channel_username}")
+        # Правила канала: фильтр и извлечение мета-данных за один вызов
+        info = rule_engine.match(channel_key, text)
+        if info is None:
+            logger.debug(f"Message filtered out: {channel_key}")
+            MESSAGES_FILTERED.inc("channel", channel_key, "filter")
             return
 
         payload = {
             "source": "channel",
-            "channel_id": message.chat.id,
+            "channel_id": chat.id,
             "channel_username": channel_username,
-            "channel_title": message.chat.title or "",
+            "channel_title": chat.title or "",
             "message_id": message.id,
             "text": text,
             "timestamp": message.date.timestamp() if message.date else None,
             "from_user": user_info,
         }
 
-        # Извлекаем мета-данные
-        info = universal_filter.extract_info(text)
-        payload["price"] = info.get("price")
+        payload["price"] = info.get("price") or None  # 0 = цена не найдена
         payload["urgency"] = info.get("urgency")
         payload["title"] = info.get("title")
+        payload["tags"] = info.get("tags")
 
         logger.debug(f"Storing channel message: {payload}")
-        await db.insert_message(payload)
+        # Queued in order; the commit completes without holding up the next message
+        await db.submit_message(payload)
 
     except Exception as e:
         logger.error(f"Error handling channel message: {e}")
@@ -1,4 +1,5 @@
 import logging
+from metrics import MESSAGES_FILTERED
 
 logger = logging.getLogger("parser.handler.private")
 
@@ -12,6 +13,7 @@ async def handle_private_message(client, message, db, registry):
         # Check if bot is globally enabled
         if not registry.enabled:
             logger.debug("Bot disabled, skipping private message")
+            MESSAGES_FILTERED.inc("private", "", "disabled")
             return
 
         # Extract message data
@@ -44,7 +46,8 @@ async def handle_private_message(client, message, db, registry):
         }
 
         logger.debug(f"Storing private message: {payload}")
-        await db.insert_message(payload)
+        # Queued in order; the commit completes without holding up the next message
+        await db.submit_message(payload)
 
     except Exception as e:
         logger.error(f"Error handling private message: {e}")
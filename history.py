@@ -1,29 +1,257 @@
 #!/usr/bin/env python3
-"""Standalone script to fetch message history from a Telegram channel."""
+"""Standalone script to fetch message history from Telegram channels."""
 
 import asyncio
 import argparse
 import logging
 import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram.errors import FloodWait
 
 from config import TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_SESSION_NAME, DB_PATH
 from db import Database
 from tg_client import build_client
 from logger import setup_logging
+from channel_registry import ChannelRegistry
+
+logger = logging.getLogger("parser.history")
+
+# messages.getHistory returns at most 100 messages per request
+HISTORY_REQUEST_LIMIT = 100
+
+
+class RateLimiter:
+    """Token bucket shared by all history requests of one process.
+
+    A FloodWait reported by any request pauses every later request until the
+    wait expires, since Telegram applies it to the whole account.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def flood_wait(self, seconds: float) -> None:
+        """Pause all requests for the given number of seconds."""
+        resume_at = time.monotonic() + seconds
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            logger.warning(f"FloodWait: pausing history requests for {seconds}s")
+
+
+def _channel_name(channel: str) -> str:
+    """'@'-prefixed username; numeric chat ids are kept as they are."""
+    if channel.startswith("@") or channel.lstrip("-").isdigit():
+        return channel
+    return f"@{channel}"
+
+
+def _peer(channel: str):
+    """Peer for Pyrogram: int for numeric chat ids, username otherwise."""
+    return int(channel) if channel.lstrip("-").isdigit() else channel
+
+
+def _build_payload(message) -> dict:
+    """Convert a Pyrogram channel message into an insert_message payload."""
+    text = message.text or message.caption or ""
+    from_user = message.from_user
+
+    return {
+        "source": "channel",
+        "channel_id": message.chat.id,
+        "channel_username": message.chat.username,
+        "channel_title": message.chat.title or "",
+        "message_id": message.id,
+        "text": text,
+        "timestamp": message.date.timestamp() if message.date else None,
+        "from_user": {
+            "id": from_user.id if from_user else None,
+            "username": from_user.username if from_user else None,
+            "first_name": from_user.first_name if from_user else None,
+        } if from_user else None,
+    }
+
+
+async def _iter_history(
+    app,
+    channel_username: str,
+    limit: int = 0,
+    offset_id: int = 0,
+    limiter: Optional[RateLimiter] = None,
+):
+    """Yield channel messages newest first, one API request per chunk.
+
+    Every request goes through the limiter; on FloodWait the limiter is paused
+    and the same chunk is requested again.
+    """
+    fetched = 0
+    while not limit or fetched < limit:
+        chunk = HISTORY_REQUEST_LIMIT if not limit else min(HISTORY_REQUEST_LIMIT, limit - fetched)
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            messages = [
+                message
+                async for message in app.get_chat_history(
+                    _peer(channel_username), limit=chunk, offset_id=offset_id
+                )
+            ]
+        except FloodWait as e:
+            if limiter is None:
+                logger.warning(f"FloodWait on {channel_username}: sleeping {e.value}s")
+                await asyncio.sleep(e.value)
+            else:
+                limiter.flood_wait(e.value)
+            continue
+
+        for message in messages:
+            yield message
+        fetched += len(messages)
+        if len(messages) < chunk:
+            return
+        offset_id = messages[-1].id
+
 
+async def _fetch_recent(app, db, channel_username: str, limit: int) -> Tuple[int, int]:
+    """Fetch the most recent messages, inserting them one by one.
 
-async def fetch_history(channel_username: str, limit: int = 100) -> None:
+    Returns:
+        (fetched, inserted) message counts
+    """
+    count = 0
+    inserted = 0
+    async for message in app.get_chat_history(_peer(channel_username), limit=limit):
+        count += 1
+
+        # Insert (duplicates silently ignored due to UNIQUE constraint)
+        row_id = await db.insert_message(_build_payload(message))
+        if row_id:
+            inserted += 1
+
+    return count, inserted
+
+
+async def _backfill_channel(
+    app,
+    db,
+    channel_username: str,
+    limit: int,
+    page_size: int = 200,
+    limiter: Optional[RateLimiter] = None,
+) -> Tuple[int, int]:
+    """Backfill channel history in pages, resuming from the stored checkpoint.
+
+    Each page is written in a single transaction together with the range of
+    message ids it covers, so an interrupted run continues with ``offset_id``
+    from the lowest id already stored instead of re-downloading everything.
+    A repeated run first fetches messages posted since the previous one.
+
+    Args:
+        app: Started Pyrogram client
+        db: Initialized Database
+        channel_username: Channel username (e.g., '@news')
+        limit: Max messages to fetch in this run (0 = whole history)
+        page_size: Messages per insert transaction
+        limiter: Optional rate limiter shared with other channels
+
+    Returns:
+        (fetched, inserted) message counts
+    """
+    fetched = 0
+    inserted = 0
+
+    async def flush(page: list, record_range: bool) -> None:
+        nonlocal inserted
+        if not page:
+            return
+        ids = [payload["message_id"] for payload in page]
+        checkpoint = (channel_username, min(ids), max(ids)) if record_range else None
+        row_ids = await db.insert_messages(page, checkpoint=checkpoint)
+        inserted += sum(1 for row_id in row_ids if row_id)
+        logger.debug(f"{channel_username}: stored page of {len(page)}, lowest id {min(ids)}")
+
+    offset_id = 0
+    checkpoint = await db.get_history_checkpoint(channel_username)
+    if checkpoint:
+        min_id, max_id = checkpoint
+        logger.info(f"{channel_username}: resuming below message {min_id}, newer than {max_id}")
+
+        # Messages posted since the previous run (newest first, down to max_id).
+        # The range is only extended once the gap is fully closed.
+        page = []
+        newest = None
+        reached_known = False
+        async for message in _iter_history(app, channel_username, limit, limiter=limiter):
+            if message.id <= max_id:
+                reached_known = True
+                break
+            fetched += 1
+            newest = max(newest or 0, message.id)
+            page.append(_build_payload(message))
+            if len(page) >= page_size:
+                await flush(page, record_range=False)
+                page = []
+        await flush(page, record_range=False)
+
+        if newest and (reached_known or not limit or fetched < limit):
+            await db.save_history_checkpoint(channel_username, min_id, newest)
+        offset_id = min_id
+
+    remaining = limit - fetched if limit else 0
+    if limit and remaining <= 0:
+        return fetched, inserted
+
+    page = []
+    async for message in _iter_history(app, channel_username, remaining, offset_id, limiter):
+        fetched += 1
+        page.append(_build_payload(message))
+        if len(page) >= page_size:
+            await flush(page, record_range=True)
+            page = []
+    await flush(page, record_range=True)
+
+    return fetched, inserted
+
+
+async def fetch_history(
+    channel_username: str,
+    limit: int = 100,
+    backfill: bool = False,
+    page_size: int = 200,
+) -> None:
     """Fetch message history from a channel and save to database.
 
     Args:
         channel_username: Channel username (e.g., '@news')
         limit: Number of recent messages to fetch
+        backfill: Use paged, resumable backfill instead of per-message inserts
+        page_size: Messages per transaction in backfill mode
     """
-    logger = logging.getLogger("history")
-
     # Validate
-    if not channel_username.startswith("@"):
-        channel_username = f"@{channel_username}"
+    channel_username = _channel_name(channel_username)
 
     # Initialize database
     db = Database(DB_PATH)
@@ -40,38 +268,99 @@ async def fetch_history(channel_username: str, limit: int = 100) -> None:
         logger.info("Pyrogram client started")
 
         # Fetch history
-        logger.info(f"Fetching up to {limit} messages from {channel_username}...")
-
-        count = 0
-        skipped = 0
-        async for message in app.get_chat_history(channel_username, limit=limit):
-            count += 1
-
-            # Extract data
-            text = message.text or message.caption or ""
-            from_user = message.from_user
-
-            payload = {
-                "source": "channel",
-                "channel_id": message.chat.id,
-                "channel_username": message.chat.username,
-                "channel_title": message.chat.title or "",
-                "message_id": message.id,
-                "text": text,
-                "timestamp": message.date.timestamp() if message.date else None,
-                "from_user": {
-                    "id": from_user.id if from_user else None,
-                    "username": from_user.username if from_user else None,
-                    "first_name": from_user.first_name if from_user else None,
-                } if from_user else None,
-            }
-
-            # Insert (duplicates silently ignored due to UNIQUE constraint)
-            row_id = await db.insert_message(payload)
-            if not row_id:
-                skipped += 1
-
-        logger.info(f"✓ Fetched: {count}, inserted: {count - skipped}, skipped (duplicates): {skipped}")
+        if backfill:
+            logger.info(f"Backfilling up to {limit or 'all'} messages from {channel_username}...")
+            count, inserted = await _backfill_channel(app, db, channel_username, limit, page_size)
+        else:
+            logger.info(f"Fetching up to {limit} messages from {channel_username}...")
+            count, inserted = await _fetch_recent(app, db, channel_username, limit)
+
+        skipped = count - inserted
+        logger.info(f"✓ Fetched: {count}, inserted: {inserted}, skipped (duplicates): {skipped}")
+
+    except Exception as e:
+        logger.error(f"Error during history fetch: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        await app.stop()
+        await db.close()
+        logger.info("Cleanup complete")
+
+
+async def fetch_many_history(
+    channels: List[str],
+    limit: int = 0,
+    page_size: int = 200,
+    workers: int = 4,
+    rate: float = 2.0,
+    burst: int = 5,
+) -> None:
+    """Backfill several channels concurrently through a bounded worker pool.
+
+    All workers share one client, one database connection and one rate limiter.
+    Always uses the paged, checkpointed backfill (the limiter throttles its
+    page requests), so main() has no per-message mode for several channels.
+
+    Args:
+        channels: Channel usernames (e.g., ['@news', 'durov'])
+        limit: Max messages per channel (0 = whole history)
+        page_size: Messages per insert transaction
+        workers: Number of channels fetched at the same time
+        rate: History requests per second across all channels (0 = unlimited)
+        burst: Max requests sent back to back when tokens are available
+    """
+    channels = [_channel_name(ch) for ch in channels]
+    channels = list(dict.fromkeys(channels))
+
+    db = Database(DB_PATH)
+    await db.init()
+    logger.info(f"Database ready: {DB_PATH}")
+
+    app = build_client()
+    limiter = RateLimiter(rate, burst)
+    queue: asyncio.Queue = asyncio.Queue()
+    for channel_username in channels:
+        queue.put_nowait(channel_username)
+
+    # channel -> (fetched, inserted, seconds, error)
+    stats: Dict[str, Tuple[int, int, float, Optional[str]]] = {}
+
+    async def worker() -> None:
+        while True:
+            try:
+                channel_username = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.monotonic()
+            try:
+                fetched, inserted = await _backfill_channel(
+                    app, db, channel_username, limit, page_size, limiter
+                )
+                error = None
+            except Exception as e:
+                logger.error(f"Error fetching {channel_username}: {e}", exc_info=True)
+                fetched, inserted, error = 0, 0, str(e)
+            elapsed = time.monotonic() - started
+            stats[channel_username] = (fetched, inserted, elapsed, error)
+            logger.info(f"{channel_username}: fetched {fetched}, inserted {inserted} in {elapsed:.1f}s")
+
+    try:
+        await app.start()
+        logger.info("Pyrogram client started")
+        logger.info(f"Backfilling {len(channels)} channels with {workers} workers...")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(channels))))))
+
+        logger.info(f"{'Channel':<32} {'Fetched':>8} {'Inserted':>9} {'Seconds':>8} {'Msg/s':>8}")
+        for channel_username in channels:
+            fetched, inserted, elapsed, error = stats.get(channel_username, (0, 0, 0.0, "not run"))
+            rate_str = f"{fetched / elapsed:.1f}" if elapsed > 0 else "-"
+            line = f"{channel_username:<32} {fetched:>8} {inserted:>9} {elapsed:>8.1f} {rate_str:>8}"
+            logger.info(f"{line}  ✗ {error}" if error else line)
+
+        total = sum(s[0] for s in stats.values())
+        total_inserted = sum(s[1] for s in stats.values())
+        logger.info(f"✓ Fetched: {total}, inserted: {total_inserted}, skipped (duplicates): {total - total_inserted}")
 
     except Exception as e:
         logger.error(f"Error during history fetch: {e}", exc_info=True)
@@ -90,22 +379,71 @@ Examples:
   python history.py @durov              # Fetch last 100 messages
   python history.py @durov --limit 500  # Fetch last 500 messages
   python history.py durov               # (@ prefix added automatically)
+  python history.py @durov --backfill --limit 0   # Whole history, resumable
+  python history.py @a @b @c --limit 0            # Several channels concurrently
+  python history.py --all --workers 8 --rate 3    # All channels from channels.json
+
+Several channels (or --all) are always fetched in backfill mode: paged,
+checkpointed and throttled by the shared rate limiter, with or without --backfill.
         """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
     parser.add_argument(
-        "channel",
-        help="Channel username (e.g., @news or news)",
+        "channels",
+        nargs="*",
+        help="Channel username(s) (e.g., @news or news)",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Backfill every channel from the channel registry",
     )
     parser.add_argument(
         "--limit",
         type=int,
         default=100,
-        help="Number of recent messages to fetch (default: 100)",
+        help="Number of recent messages to fetch (default: 100, 0 = all with --backfill)",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Paged bulk inserts with a resumable per-channel checkpoint "
+        "(always on with several channels or --all)",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=200,
+        help="Messages per transaction in backfill mode (default: 200)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Channels fetched concurrently in multi-channel mode (default: 4)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="History requests per second across all channels, 0 = unlimited (default: 2)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=5,
+        help="Max back-to-back requests of the rate limiter (default: 5)",
     )
 
     args = parser.parse_args()
 
+    channels = list(args.channels)
+    if args.all:
+        channels.extend(ChannelRegistry().usernames())
+    if not channels:
+        parser.error("specify at least one channel or --all")
+
     # Setup logging
     setup_logging()
 
@@ -115,7 +453,12 @@ Examples:
         sys.exit(1)
 
     # Fetch history
-    await fetch_history(args.channel, args.limit)
+    if len(channels) > 1 or args.all:
+        await fetch_many_history(
+            channels, args.limit, args.page_size, args.workers, args.rate, args.burst
+        )
+    else:
+        await fetch_history(channels[0], args.limit, args.backfill, args.page_size)
 
 
 if __name__ == "__main__":
@@ -2,10 +2,46 @@ import asyncio
 import logging
 from pyrogram import idle
 from logger import setup_logging
-from config import TELEGRAM_API_ID, TELEGRAM_API_HASH, DB_PATH
+from config import (
+    TELEGRAM_API_ID,
+    TELEGRAM_API_HASH,
+    DB_PATH,
+    DB_WRITE_BEHIND,
+    DB_BATCH_SIZE,
+    DB_FLUSH_INTERVAL_MS,
+    DB_QUEUE_SIZE,
+    DB_RECENT_KEYS,
+    VOICE_PRELOAD,
+    VOICE_CACHE_SIZE,
+    NOTIFY_SOCKET,
+    NEAR_DUP_WINDOW,
+    NEAR_DUP_THRESHOLD,
+    NEAR_DUP_MAX_ENTRIES,
+    NEAR_DUP_MIN_WORDS,
+    METRICS_HOST,
+    METRICS_PORT,
+    METRICS_FILE,
+    METRICS_INTERVAL,
+    LOOP_STALL_THRESHOLD_MS,
+    PROFILE,
+    PROFILE_FILE,
+    PROFILE_INTERVAL,
+    PROFILE_SAMPLE_MS,
+    FILTER_RULES_FILE,
+    FILTER_RULES_RELOAD_INTERVAL,
+    INGEST_LANES,
+    INGEST_LANE_QUEUE_SIZE,
+)
 from tg_client import build_client, register_handlers
 from db import Database
+from dedup import NearDuplicateIndex
+from dispatcher import IngestDispatcher
 from channel_registry import ChannelRegistry
+from filters.rules import rule_engine
+from changefeed import ChangeNotifier
+from metrics import dump_metrics_periodically, start_http_server, write_metrics_file
+from profiling import DB_METHODS, LoopWatchdog, profiler
+from voice_handler import drain_background_tasks, preload_voice_models
 
 logger = logging.getLogger("parser.main")
 
@@ -21,18 +57,75 @@ async def main():
         logger.error("TELEGRAM_API_ID and TELEGRAM_API_HASH are required")
         return
 
+    # Must be set before anything is wrapped
+    profiler.enabled = PROFILE
+
     # Initialize components
     registry = ChannelRegistry()
-    db = Database(DB_PATH)
+    notifier = ChangeNotifier(NOTIFY_SOCKET) if NOTIFY_SOCKET else None
+    near_duplicates = NearDuplicateIndex(
+        threshold=NEAR_DUP_THRESHOLD,
+        window=NEAR_DUP_WINDOW,
+        max_entries=NEAR_DUP_MAX_ENTRIES,
+        min_words=NEAR_DUP_MIN_WORDS,
+    ) if NEAR_DUP_WINDOW > 0 else None
+    db = Database(
+        DB_PATH,
+        write_behind=DB_WRITE_BEHIND,
+        batch_size=DB_BATCH_SIZE,
+        flush_interval_ms=DB_FLUSH_INTERVAL_MS,
+        queue_size=DB_QUEUE_SIZE,
+        recent_keys=DB_RECENT_KEYS,
+        transcription_cache_size=VOICE_CACHE_SIZE,
+        notifier=notifier,
+        near_duplicates=near_duplicates,
+    )
     app = None
+    dispatcher = IngestDispatcher(INGEST_LANES, INGEST_LANE_QUEUE_SIZE) if INGEST_LANES > 0 else None
+    metrics_server = None
+    background_tasks = []
+    watchdog = LoopWatchdog(LOOP_STALL_THRESHOLD_MS)
+    watchdog.start()
+    if PROFILE:
+        profiler.instrument(db, DB_METHODS)
+        profiler.start_sampling(PROFILE_SAMPLE_MS)
+        background_tasks.append(
+            asyncio.create_task(profiler.report_periodically(PROFILE_FILE, PROFILE_INTERVAL))
+        )
+        logger.info(f"Profiling enabled, reports go to {PROFILE_FILE}")
 
     try:
         # Initialize database
         await db.init()
+        if notifier is not None:
+            await notifier.start()
+
+        # Per-channel filter rules, reloaded when the file changes
+        rule_engine.load(FILTER_RULES_FILE)
+        if FILTER_RULES_RELOAD_INTERVAL > 0:
+            background_tasks.append(
+                asyncio.create_task(rule_engine.watch(FILTER_RULES_RELOAD_INTERVAL))
+            )
+
+        # Metrics exporters
+        if METRICS_PORT:
+            metrics_server = await start_http_server(METRICS_HOST, METRICS_PORT)
+        if METRICS_FILE:
+            background_tasks.append(
+                asyncio.create_task(dump_metrics_periodically(METRICS_FILE, METRICS_INTERVAL))
+            )
 
-        # Build and register Pyrogram client
-        app = build_client()
-        register_handlers(app, db, registry)
+        # Build and register Pyrogram client. With the dispatcher a single
+        # Pyrogram worker only enqueues updates, which keeps arrival order;
+        # the lanes provide the concurrency.
+        if dispatcher is not None:
+            dispatcher.start()
+        app = build_client(workers=1 if dispatcher is not None else None)
+        register_handlers(app, db, registry, dispatcher)
+
+        # Whisper loads in the background so the client starts immediately
+        if VOICE_PRELOAD:
+            background_tasks.append(asyncio.create_task(preload_voice_models()))
 
         logger.info("Starting Pyrogram client")
         await app.start()
@@ -52,10 +145,57 @@ async def main():
                 await app.stop()
             except Exception as e:
                 logger.warning(f"Error stopping app: {e}")
+        try:
+            # Transcriptions in flight still write to the lanes and the DB
+            await drain_background_tasks()
+        except Exception as e:
+            logger.warning(f"Error finishing voice transcriptions: {e}")
+        if dispatcher is not None:
+            try:
+                # Handle messages already accepted before the DB is drained
+                await dispatcher.close()
+            except Exception as e:
+                logger.warning(f"Error closing dispatcher: {e}")
+        try:
+            # Commit everything still queued by the write-behind pipeline
+            await db.drain()
+            # Transcripts of rows that were still queued are written once they commit
+            await drain_background_tasks()
+        except Exception as e:
+            logger.warning(f"Error draining database queue: {e}")
+        try:
+            # Write registry changes still waiting for the debounced save
+            await registry.flush()
+        except Exception as e:
+            logger.warning(f"Error saving channel registry: {e}")
         try:
             await db.close()
         except Exception as e:
             logger.warning(f"Error closing database: {e}")
+        if notifier is not None:
+            try:
+                await notifier.close()
+            except Exception as e:
+                logger.warning(f"Error closing change notifier: {e}")
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        if METRICS_FILE:
+            try:
+                # Final snapshot including the shutdown drain
+                write_metrics_file(METRICS_FILE)
+            except Exception as e:
+                logger.warning(f"Failed to write metrics file: {e}")
+        await watchdog.stop()
+        if PROFILE:
+            profiler.stop_sampling()
+            try:
+                profiler.write_report(PROFILE_FILE)
+            except Exception as e:
+                logger.warning(f"Failed to write profile report: {e}")
         logger.info("Shutdown complete")
 
 
@@ -0,0 +1,278 @@
+"""Prometheus-style metrics for the ingestion pipeline.
+
+Metrics are module-level objects updated from the handlers, Database and
+voice_handler. They are exposed in the Prometheus text format over HTTP
+(GET /metrics on METRICS_PORT) and/or written periodically to METRICS_FILE
+for hosts without network access.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger("parser.metrics")
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WHISPER_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        # Updated from the event loop and from Whisper worker threads
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; may be computed at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], *labels: str) -> None:
+        """Evaluate fn on every render, e.g. to report a queue's current size."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} function failed: {e}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = {key: (list(c), s, n) for key, (c, s, n) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+MESSAGES_RECEIVED = registry.counter(
+    "parser_messages_received_total", "Updates received from Telegram", ["source", "channel"]
+)
+MESSAGES_FILTERED = registry.counter(
+    "parser_messages_filtered_total", "Messages skipped before storage", ["source", "channel", "reason"]
+)
+MESSAGES_INSERTED = registry.counter(
+    "parser_messages_inserted_total", "Messages stored in the database", ["source", "channel"]
+)
+MESSAGES_DUPLICATE = registry.counter(
+    "parser_messages_duplicate_total", "Inserts ignored as duplicates", ["source", "channel"]
+)
+MESSAGES_NEAR_DUPLICATE = registry.counter(
+    "parser_messages_near_duplicate_total",
+    "Stored messages clustered with an earlier near-identical one", ["source", "channel"],
+)
+RECENT_KEYS = registry.gauge("parser_recent_keys", "Message keys held in the recent-message cache")
+RECENT_KEYS_LOOKUPS = registry.counter(
+    "parser_recent_keys_lookups_total",
+    "Inserts checked against the in-memory recent-message cache", ["result"],
+)
+INSERT_LATENCY = registry.histogram(
+    "parser_insert_latency_seconds", "Database.insert_message latency incl. queueing"
+)
+COMMIT_BATCH_SIZE = registry.histogram(
+    "parser_commit_batch_size", "Messages written per database transaction", buckets=BATCH_BUCKETS
+)
+QUEUE_DEPTH = registry.gauge("parser_queue_depth", "Items waiting in internal queues", ["queue"])
+WHISPER_LATENCY = registry.histogram(
+    "parser_whisper_latency_seconds", "Whisper decode + transcription time per batch",
+    buckets=WHISPER_BUCKETS,
+)
+WHISPER_CLIPS = registry.counter(
+    "parser_whisper_clips_total", "Voice clips by outcome", ["result"]
+)
+EVENT_LOOP_LAG = registry.gauge("parser_event_loop_lag_seconds", "Last measured event-loop lag")
+LOOP_STALLS = registry.counter(
+    "parser_event_loop_stalls_total", "Times the event loop was blocked past the stall threshold"
+)
+
+
+def channel_label(payload: dict) -> str:
+    """Channel label for a message payload: username, else chat id ('' for private chats)."""
+    if payload.get("source") != "channel":
+        return ""
+    return payload.get("channel_username") or str(payload.get("channel_id") or "")
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Minimal HTTP/1.0 responder for GET /metrics."""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Skip headers
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = registry.render().encode()
+            status = "200 OK"
+        else:
+            body = b"Not Found\n"
+            status = "404 Not Found"
+        writer.write(
+            f"HTTP/1.0 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve /metrics on host:port."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+def write_metrics_file(path: str) -> None:
+    """Write the current metrics to path atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+async def dump_metrics_periodically(path: str, interval: float = 15.0) -> None:
+    """Rewrite the metrics file every interval seconds."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    while True:
+        try:
+            await asyncio.to_thread(write_metrics_file, path)
+        except Exception as e:
+            logger.warning(f"Failed to write metrics file: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,298 @@
+"""Event-loop stall watchdog and opt-in hot-path profiler.
+
+LoopWatchdog always publishes event-loop lag; when the loop stops
+responding for longer than the threshold, a helper thread logs the stack
+the loop thread is stuck in, which points at the blocking call.
+
+With PROFILE enabled, handlers and Database methods are wrapped with timers
+(wall time and CPU time spent on the loop thread) and the loop thread is
+sampled periodically; both are written as a text report to PROFILE_FILE.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as TallyCounter
+from typing import Dict, Iterable, List, Optional
+
+from metrics import EVENT_LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger("parser.profiling")
+
+# Database methods timed in profiling mode
+DB_METHODS = (
+    "insert_message",
+    "submit_message",
+    "insert_messages",
+    "set_transcript",
+    "get_cached_transcription",
+    "cache_transcription",
+    "_insert_transaction",
+    "_flush_batch",
+)
+
+
+def _format_stack(frame, limit: int = 30) -> str:
+    return "".join(traceback.format_stack(frame, limit=limit))
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and dumps the stack of code that blocks it."""
+
+    def __init__(self, threshold_ms: float = 250, interval: float = 0.1):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start the heartbeat task and, with a threshold set, the watcher thread."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        if self.threshold > 0:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            EVENT_LOOP_LAG.set(lag)
+            if self.threshold > 0 and lag >= self.threshold:
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        """Runs in a thread: the loop cannot report on itself while it is blocked."""
+        reported = None
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            # One stack per stall; the heartbeat logs the total duration afterwards
+            if stalled < self.threshold + self.interval or beat == reported:
+                continue
+            reported = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = _format_stack(frame) if frame is not None else "<unavailable>\n"
+            logger.warning(
+                f"Event loop blocked for {stalled * 1000:.0f} ms so far, loop thread stack:\n{stack}"
+            )
+
+    async def stop(self) -> None:
+        """Stop the heartbeat and the watcher thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class _Stat:
+    __slots__ = ("calls", "errors", "wall", "cpu", "max_wall")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+
+
+class _TimedCoroutine:
+    """Awaitable that drives a coroutine and times each step it runs.
+
+    CPU time is taken with time.thread_time() around every resumption, so it
+    counts only work done on the loop thread by this coroutine, not time spent
+    waiting or work done by other tasks in between.
+    """
+
+    def __init__(self, profiler: "Profiler", name: str, coro):
+        self._profiler = profiler
+        self._name = name
+        self._coro = coro
+
+    def __await__(self):
+        coro = self._coro
+        cpu = 0.0
+        started = time.perf_counter()
+        failed = False
+        send, throw = None, None
+        try:
+            while True:
+                step = time.thread_time()
+                try:
+                    if throw is not None:
+                        future = coro.throw(throw)
+                    else:
+                        future = coro.send(send)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    cpu += time.thread_time() - step
+                send, throw = None, None
+                try:
+                    send = yield future
+                except GeneratorExit:
+                    coro.close()
+                    raise
+                except BaseException as e:
+                    throw = e
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._profiler.record(self._name, time.perf_counter() - started, cpu, failed)
+
+
+class Profiler:
+    """Per-function timings plus a sampling view of the loop thread."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.monotonic()
+        self._stats: Dict[str, _Stat] = {}
+        self._samples: TallyCounter = TallyCounter()
+        self._sample_count = 0
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def record(self, name: str, wall: float, cpu: float, failed: bool = False) -> None:
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = _Stat()
+            stat.calls += 1
+            stat.errors += failed
+            stat.wall += wall
+            stat.cpu += cpu
+            stat.max_wall = max(stat.max_wall, wall)
+
+    def wrap(self, fn, name: Optional[str] = None):
+        """Return fn timed under name; fn itself when profiling is off."""
+        if not self.enabled:
+            return fn
+        name = name or getattr(fn, "__qualname__", repr(fn))
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                return await _TimedCoroutine(self, name, fn(*args, **kwargs))
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started, cpu_started = time.perf_counter(), time.thread_time()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.record(
+                    name, time.perf_counter() - started, time.thread_time() - cpu_started, failed
+                )
+        return timed
+
+    def instrument(self, obj, method_names: Iterable[str]) -> None:
+        """Replace the named methods of obj (an instance) with timed versions."""
+        if not self.enabled:
+            return
+        prefix = type(obj).__name__
+        for method_name in method_names:
+            method = getattr(obj, method_name, None)
+            if method is not None:
+                setattr(obj, method_name, self.wrap(method, f"{prefix}.{method_name}"))
+
+    def start_sampling(self, interval_ms: float = 10) -> None:
+        """Sample the calling (loop) thread's stack from a helper thread."""
+        if not self.enabled or interval_ms <= 0:
+            return
+        target = threading.get_ident()
+        self._stopped.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(target, interval_ms / 1000), name="profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def _sample(self, target: int, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            code = frame.f_code
+            key = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+            with self._lock:
+                self._samples[key] += 1
+                self._sample_count += 1
+
+    def stop_sampling(self) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def report(self, top: int = 20) -> str:
+        """Text report: timed functions by total wall time, then hottest sampled lines."""
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda item: item[1].wall, reverse=True)
+            samples = self._samples.most_common(top)
+            sample_count = self._sample_count
+
+        lines: List[str] = [
+            f"Profile after {time.monotonic() - self.started:.0f}s",
+            "",
+            f"{'function':<40} {'calls':>9} {'errors':>7} {'wall s':>10} "
+            f"{'loop cpu s':>11} {'avg ms':>9} {'max ms':>9}",
+        ]
+        for name, stat in stats:
+            avg = stat.wall / stat.calls * 1000 if stat.calls else 0.0
+            lines.append(
+                f"{name:<40} {stat.calls:>9} {stat.errors:>7} {stat.wall:>10.3f} "
+                f"{stat.cpu:>11.3f} {avg:>9.2f} {stat.max_wall * 1000:>9.2f}"
+            )
+
+        if sample_count:
+            lines += ["", f"Loop thread samples: {sample_count}", ""]
+            for key, count in samples:
+                lines.append(f"{count / sample_count * 100:6.1f}%  {key}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str) -> None:
+        """Write the report to path atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.report())
+        os.replace(tmp_path, path)
+
+    async def report_periodically(self, path: str, interval: float = 60.0) -> None:
+        """Rewrite the report file every interval seconds."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write_report, path)
+            except Exception as e:
+                logger.warning(f"Failed to write profile report: {e}")
+
+
+profiler = Profiler()
@@ -6,6 +6,8 @@ import argparse
 from pathlib import Path
 from typing import Optional
 
+from reader import MessageReader
+
 
 def query_messages(
     db_path: str,
@@ -14,6 +16,13 @@ def query_messages(
     search: Optional[str] = None,
     since: Optional[str] = None,
     limit: int = 20,
+    min_price: Optional[int] = None,
+    urgent: bool = False,
+    tag: Optional[str] = None,
+    unique: bool = False,
+    until: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
 ) -> None:
     """Query messages from the database.
 
@@ -21,55 +30,48 @@ def query_messages(
         db_path: Path to SQLite database
         channel: Filter by channel username (e.g., '@news')
         source: Filter by source ('channel' or 'private')
-        search: Search text
-        since: Date filter (YYYY-MM-DD)
+        search: Full-text query (words, "phrase", prefix*), ranked by bm25
+        since: Messages sent at or after this date/time (YYYY-MM-DD or ISO, UTC)
         limit: Max number of results
+        min_price: Only messages with an extracted price of at least this value
+        urgent: Only messages marked as urgent
+        tag: Only messages tagged with this keyword/watchlist term
+        unique: One message per near-duplicate cluster (reposts hidden)
+        until: Messages sent before this date/time (YYYY-MM-DD or ISO, UTC)
+        before_id: Keyset cursor: rows with id below this, newest first
+        after_id: Keyset cursor: rows with id above this, oldest first
     """
     if not Path(db_path).exists():
         print(f"❌ Database not found: {db_path}")
         return
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Build query
-    where_clauses = []
-    params = []
-
-    if source:
-        where_clauses.append("source = ?")
-        params.append(source)
-
-    if channel:
-        where_clauses.append("channel_username = ?")
-        params.append(channel)
-
-    if search:
-        where_clauses.append("text LIKE ?")
-        params.append(f"%{search}%")
-
-    if since:
-        where_clauses.append("DATE(created_at) >= ?")
-        params.append(since)
-
-    where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
-    sql = f"""
-        SELECT id, source, channel_username, chat_id, message_id,
-               text, timestamp, from_username, created_at
-        FROM messages
-        WHERE {where_clause}
-        ORDER BY created_at DESC
-        LIMIT ?
-    """
-    params.append(limit)
-
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
+    reader = MessageReader(db_path, pool_size=1)
+    try:
+        rows = reader.query(
+            channel=channel,
+            source=source,
+            search=search,
+            since=since,
+            until=until,
+            min_price=min_price,
+            urgent=urgent,
+            tag=tag,
+            representatives=unique,
+            before_id=before_id,
+            after_id=after_id,
+            limit=limit,
+        )
+    except ValueError as e:
+        print(f"❌ Invalid date: {e}")
+        return
+    except sqlite3.OperationalError as e:
+        print(f"❌ Invalid search query: {e}")
+        return
+    finally:
+        reader.close()
 
     if not rows:
         print("No messages found")
-        conn.close()
         return
 
     # Display results
@@ -77,17 +79,21 @@ def query_messages(
     print("-" * 130)
 
     for row in rows:
-        source_str = row["source"]
-        channel_or_user = row["channel_username"] or row["from_username"] or "?"
-        text_preview = (row["text"] or "")[:45] + ("..." if len(row["text"] or "") > 45 else "")
-        time_str = row["created_at"][:19] if row["created_at"] else "?"
+        channel_or_user = row.channel_username or row.from_username or "?"
+        text = (row.snippet or row.text or row.transcript or "").replace("\n", " ")
+        text_preview = text[:45] + ("..." if len(text) > 45 else "")
+        time_str = row.created_at[:19] if row.created_at else "?"
 
         print(
-            f"{row['id']:<6} | {source_str:<10} | {channel_or_user:<20} | {text_preview:<50} | {time_str:<19}"
+            f"{row.id:<6} | {row.source:<10} | {channel_or_user:<20} | {text_preview:<50} | {time_str:<19}"
         )
 
     print(f"\n✓ Total: {len(rows)} messages")
-    conn.close()
+    if len(rows) == limit and not search:
+        if after_id is not None:
+            print(f"  Next page: --after-id {rows[-1].id}")
+        else:
+            print(f"  Next page: --before {rows[-1].id}")
 
 
 def main():
@@ -99,8 +105,16 @@ Examples:
   python query.py                          # Last 20 messages
   python query.py --channel @news          # From @news channel
   python query.py --source private         # Private messages only
-  python query.py --search bitcoin         # Text search
+  python query.py --search bitcoin         # Full-text search, best matches first
+  python query.py --search '"новый заказ"' # Exact phrase
+  python query.py --search 'разраб*'       # Prefix search
   python query.py --since 2025-02-01       # Since date
+  python query.py --since 2025-02-01 --until 2025-02-08  # Date range
+  python query.py --before 1200            # Next page of older messages
+  python query.py --after-id 1200          # Messages added after id 1200
+  python query.py --min-price 5000 --urgent  # Urgent orders from 5000₽
+  python query.py --tag python             # Tagged by channel keyword rules
+  python query.py --unique                 # Hide reposts of the same text
   python query.py --limit 50               # Custom limit
         """,
     )
@@ -121,11 +135,46 @@ Examples:
     )
     parser.add_argument(
         "--search",
-        help="Search text",
+        help="Full-text search (words, \"phrase\", prefix*, AND/OR/NOT)",
     )
     parser.add_argument(
         "--since",
-        help="Date filter (YYYY-MM-DD)",
+        help="Messages sent at or after date (YYYY-MM-DD or ISO datetime, UTC)",
+    )
+    parser.add_argument(
+        "--until",
+        help="Messages sent before date (YYYY-MM-DD or ISO datetime, UTC)",
+    )
+    parser.add_argument(
+        "--before",
+        type=int,
+        metavar="ID",
+        help="Page cursor: messages with id below ID, newest first",
+    )
+    parser.add_argument(
+        "--after-id",
+        type=int,
+        metavar="ID",
+        help="Page cursor: messages with id above ID, oldest first",
+    )
+    parser.add_argument(
+        "--min-price",
+        type=int,
+        help="Minimum extracted price",
+    )
+    parser.add_argument(
+        "--urgent",
+        action="store_true",
+        help="Urgent messages only",
+    )
+    parser.add_argument(
+        "--tag",
+        help="Messages tagged with a keyword/watchlist term",
+    )
+    parser.add_argument(
+        "--unique",
+        action="store_true",
+        help="One message per near-duplicate cluster (hide reposts)",
     )
     parser.add_argument(
         "--limit",
@@ -143,6 +192,13 @@ Examples:
         search=args.search,
         since=args.since,
         limit=args.limit,
+        min_price=args.min_price,
+        urgent=args.urgent,
+        tag=args.tag,
+        unique=args.unique,
+        until=args.until,
+        before_id=args.before,
+        after_id=args.after_id,
     )
 
 
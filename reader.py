@@ -0,0 +1,373 @@
+"""Read-side API over parser.db for consumers running in other processes.
+
+Example:
+    reader = MessageReader("parser.db")
+    for record in reader.query(channel="news", since="2025-02-01", limit=50):
+        print(record.id, record.text)
+
+    # In asyncio code
+    areader = AsyncMessageReader("parser.db")
+    records = await areader.query(after_id=last_id)
+
+    # Follow new rows as they are committed
+    async for record in areader.tail(since_seq=last_id, notify_path="parser.sock"):
+        ...
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+
+from filters.keyword_index import fold
+
+logger = logging.getLogger("parser.reader")
+
+# Characters and keywords that mark a search string as FTS5 query syntax
+_FTS_SYNTAX = ('"', "*", "(", ")", " AND ", " OR ", " NOT ", "NEAR(", "^")
+
+_COLUMNS = """
+    m.id, m.source, m.channel_id, m.channel_username, m.channel_title,
+    m.chat_id, m.message_id, m.text, m.transcript, m.timestamp,
+    m.from_user_id, m.from_username, m.price, m.urgency, m.title, m.created_at,
+    m.cluster_id
+"""
+
+
+class MessageRecord(NamedTuple):
+    """One row of the messages table."""
+
+    id: int
+    source: str
+    channel_id: Optional[int]
+    channel_username: Optional[str]
+    channel_title: Optional[str]
+    chat_id: Optional[int]
+    message_id: int
+    text: Optional[str]
+    transcript: Optional[str]
+    timestamp: Optional[float]
+    from_user_id: Optional[int]
+    from_username: Optional[str]
+    price: Optional[int]
+    urgency: Optional[int]
+    title: Optional[str]
+    created_at: Optional[str]
+    # Row id of the first message of its near-duplicate cluster (None if it is one)
+    cluster_id: Optional[int] = None
+    # Highlighted match, only set for full-text searches
+    snippet: Optional[str] = None
+
+
+def fts_query(search: str) -> str:
+    """Convert user input into an FTS5 MATCH expression.
+
+    Plain words are quoted and AND-ed, so punctuation cannot break the query.
+    Input already using FTS5 syntax ("phrase", prefix*, AND/OR/NOT, NEAR) is
+    passed through unchanged. ё is folded to е, as in the index.
+    """
+    search = search.replace("ё", "е").replace("Ё", "Е")
+    if any(token in search for token in _FTS_SYNTAX):
+        return search
+    words = search.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def to_timestamp(value: str) -> float:
+    """Parse YYYY-MM-DD or an ISO datetime (UTC unless an offset is given) to epoch seconds."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class MessageReader:
+    """Synchronous reader backed by a small pool of read-only connections.
+
+    Connections are opened once with query_only and mmap_size pragmas and keep
+    sqlite3's prepared-statement cache, so repeated polls skip connection
+    setup and SQL parsing. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pool_size: int = 4,
+        mmap_size: int = 256 * 1024 * 1024,
+        cached_statements: int = 64,
+    ):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._pool: queue.Queue = queue.Queue()
+        self._connections: List[sqlite3.Connection] = []
+        for _ in range(max(1, pool_size)):
+            conn = self._connect()
+            self._connections.append(conn)
+            self._pool.put(conn)
+
+        with self._connection() as conn:
+            tables = {
+                name for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' "
+                    "AND name IN ('messages_fts', 'message_tags')"
+                )
+            }
+        self.has_fts = "messages_fts" in tables
+        self.has_tags = "message_tags" in tables
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a read-only connection to the database."""
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA query_only=1")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool."""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def query(
+        self,
+        channel: Optional[str] = None,
+        source: Optional[str] = None,
+        search: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        min_price: Optional[int] = None,
+        urgent: bool = False,
+        tag: Optional[str] = None,
+        representatives: bool = False,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 20,
+    ) -> List[MessageRecord]:
+        """Return messages matching the filters.
+
+        Args:
+            channel: Filter by channel username
+            source: Filter by source ('channel' or 'private')
+            search: Full-text query (words, "phrase", prefix*), ranked by bm25
+            since: Messages sent at or after this date/time (YYYY-MM-DD or ISO, UTC)
+            until: Messages sent before this date/time (YYYY-MM-DD or ISO, UTC)
+            min_price: Only messages with an extracted price of at least this value
+            urgent: Only messages marked as urgent
+            tag: Only messages tagged with this keyword/watchlist term
+            representatives: One message per near-duplicate cluster (skip reposts)
+            before_id: Keyset cursor: rows with id below this, newest first
+            after_id: Keyset cursor: rows with id above this, oldest first
+            limit: Max number of results
+
+        Raises:
+            ValueError: If since/until is not a valid date
+            sqlite3.OperationalError: If the search expression is invalid
+        """
+        where_clauses = []
+        params = []
+        use_fts = bool(search) and self.has_fts
+
+        if use_fts:
+            where_clauses.append("messages_fts MATCH ?")
+            params.append(fts_query(search))
+
+        if source:
+            where_clauses.append("m.source = ?")
+            params.append(source)
+
+        if channel:
+            where_clauses.append("m.channel_username = ?")
+            params.append(channel)
+
+        if search and not use_fts:
+            # Database created before the FTS index: fall back to a full scan
+            where_clauses.append("m.text LIKE ?")
+            params.append(f"%{search}%")
+
+        # Range predicates on indexed columns only (no functions on columns)
+        if since:
+            where_clauses.append("m.timestamp >= ?")
+            params.append(to_timestamp(since))
+
+        if until:
+            where_clauses.append("m.timestamp < ?")
+            params.append(to_timestamp(until))
+
+        if min_price is not None:
+            where_clauses.append("m.price >= ?")
+            params.append(min_price)
+
+        if urgent:
+            where_clauses.append("m.urgency = 1")
+
+        if tag:
+            if self.has_tags:
+                # Tags are stored normalized, see filters.keyword_index.fold
+                where_clauses.append("m.id IN (SELECT message_id FROM message_tags WHERE tag = ?)")
+                params.append(fold(tag.rstrip("*").strip()))
+            else:
+                where_clauses.append("0")
+
+        if representatives:
+            where_clauses.append("m.cluster_id IS NULL")
+
+        if before_id is not None:
+            where_clauses.append("m.id < ?")
+            params.append(before_id)
+
+        if after_id is not None:
+            where_clauses.append("m.id > ?")
+            params.append(after_id)
+
+        where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
+        if use_fts:
+            # Ranked by bm25, snippet taken from whichever column matched best
+            sql = f"""
+                SELECT {_COLUMNS}, snippet(messages_fts, -1, '[', ']', '…', 8)
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE {where_clause}
+                ORDER BY bm25(messages_fts)
+                LIMIT ?
+            """
+        else:
+            sql = f"""
+                SELECT {_COLUMNS}
+                FROM messages m
+                WHERE {where_clause}
+                ORDER BY m.id {"ASC" if after_id is not None else "DESC"}
+                LIMIT ?
+            """
+        params.append(limit)
+
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [MessageRecord(*row) for row in rows]
+
+    def get(self, row_id: int) -> Optional[MessageRecord]:
+        """Return a single message by row id."""
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM messages m WHERE m.id = ?", (row_id,)
+            ).fetchone()
+        return MessageRecord(*row) if row else None
+
+    def cluster(self, row_id: int) -> List[MessageRecord]:
+        """All stored copies of a message: its cluster representative first, then reposts."""
+        with self._connection() as conn:
+            (cluster_id,) = conn.execute(
+                "SELECT COALESCE(cluster_id, id) FROM messages WHERE id = ?", (row_id,)
+            ).fetchone() or (None,)
+            if cluster_id is None:
+                return []
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM messages m WHERE m.id = ? OR m.cluster_id = ? ORDER BY m.id",
+                (cluster_id, cluster_id),
+            ).fetchall()
+        return [MessageRecord(*row) for row in rows]
+
+    def tags(self, row_id: int) -> List[str]:
+        """Keyword/watchlist terms stored for a message."""
+        if not self.has_tags:
+            return []
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT tag FROM message_tags WHERE message_id = ? ORDER BY tag", (row_id,)
+            ).fetchall()
+        return [tag for (tag,) in rows]
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+
+
+class AsyncMessageReader:
+    """Asyncio wrapper running MessageReader queries in worker threads."""
+
+    def __init__(self, db_path: str, pool_size: int = 4, **kwargs):
+        self._reader = MessageReader(db_path, pool_size=pool_size, **kwargs)
+
+    @property
+    def has_fts(self) -> bool:
+        return self._reader.has_fts
+
+    async def query(self, **filters) -> List[MessageRecord]:
+        """Async version of MessageReader.query (same keyword arguments)."""
+        return await asyncio.to_thread(self._reader.query, **filters)
+
+    async def get(self, row_id: int) -> Optional[MessageRecord]:
+        """Async version of MessageReader.get."""
+        return await asyncio.to_thread(self._reader.get, row_id)
+
+    async def cluster(self, row_id: int) -> List[MessageRecord]:
+        """Async version of MessageReader.cluster."""
+        return await asyncio.to_thread(self._reader.cluster, row_id)
+
+    async def tags(self, row_id: int) -> List[str]:
+        """Async version of MessageReader.tags."""
+        return await asyncio.to_thread(self._reader.tags, row_id)
+
+    async def tail(
+        self,
+        since_seq: int = 0,
+        notify_path: Optional[str] = None,
+        batch_size: int = 500,
+        poll_interval: float = 1.0,
+    ) -> AsyncIterator[MessageRecord]:
+        """Yield every message with id above since_seq, then follow new commits.
+
+        The sequence is the message id, which only grows; pass the id of the
+        last record handled to resume. With notify_path (the parser's
+        NOTIFY_SOCKET) the generator wakes right after each commit; without
+        it, or while the socket is unavailable, it polls every poll_interval.
+        """
+        seq = since_seq
+        notifications: Optional[asyncio.StreamReader] = None
+        writer: Optional[asyncio.StreamWriter] = None
+        try:
+            while True:
+                records = await self.query(after_id=seq, limit=batch_size)
+                for record in records:
+                    yield record
+                    seq = record.id
+                if len(records) == batch_size:
+                    continue
+
+                if notify_path and notifications is None:
+                    try:
+                        notifications, writer = await asyncio.open_unix_connection(notify_path)
+                    except OSError:
+                        notifications = None
+
+                if notifications is None:
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                try:
+                    line = await asyncio.wait_for(notifications.readline(), poll_interval)
+                except asyncio.TimeoutError:
+                    continue
+                if not line:
+                    # Parser restarted or went away: reconnect on the next round
+                    writer.close()
+                    notifications, writer = None, None
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+        self._reader.close()
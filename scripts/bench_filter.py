@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк UniversalFilter.extract_info
+
+Сравнивает текущую реализацию с прежней (re без компиляции, два поиска
+цены с IGNORECASE, re.sub для эмодзи, отдельный lower() для срочности) и
+проверяет, что обе возвращают одинаковые поля.
+
+    python scripts/bench_filter.py --messages 5000 --repeat 5
+"""
+
+import argparse
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+# Добавляем корень проекта в path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from filters.universal_filter import universal_filter
+
+_WORDS = (
+    "нужен разработчик бот telegram python парсер сайт лендинг дизайн логотип "
+    "верстка django fastapi интеграция api crm задача проект доработка ошибка "
+    "сервер настройка база данных скрипт автоматизация"
+).split()
+
+
+def legacy_extract_info(text: str) -> dict:
+    """Прежняя реализация extract_info (без timestamp и full_text)"""
+    lines = text.strip().split('\n')
+    title = ""
+    if lines:
+        title = re.sub(r'[🔥💰⏰📝🔗]', '', lines[0]).strip()
+
+    price = 0
+    match = re.search(r'от\s+([\d]+)₽', text, re.IGNORECASE)
+    if match:
+        price = int(match.group(1))
+    else:
+        match = re.search(r'([\d]+)\s*-\s*([\d]+)₽', text, re.IGNORECASE)
+        if match:
+            price = int(match.group(1))
+
+    urgency_keywords = ["срочно", "сегодня", "urgent", "fast", "🔥"]
+    urgency = any(kw in text.lower() for kw in urgency_keywords)
+    return {"title": title[:100], "price": price, "urgency": urgency}
+
+
+def sample_texts(count: int, seed: int) -> list:
+    """Сообщения, похожие на заказы из каналов"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        body = " ".join(rng.choices(_WORDS, k=rng.randint(10, 200)))
+        roll = rng.random()
+        if roll < 0.3:
+            body += f"\n💰 Бюджет: от {rng.randint(1, 90) * 500}₽"
+        elif roll < 0.5:
+            body += f"\n💰 {rng.randint(1, 9) * 1000}-{rng.randint(10, 20) * 1000}₽"
+        if rng.random() < 0.2:
+            body = "Срочно! " + body
+        texts.append(f"📝 Заказ #{rng.randint(1, 10 ** 6)}: {rng.choice(_WORDS)}\n{body}")
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микро-бенчмарк UniversalFilter.extract_info")
+    parser.add_argument("--messages", type=int, default=5000, help="Сколько сообщений")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов (берётся лучший)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора текстов")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.messages, args.seed)
+
+    for text in texts:
+        new = universal_filter.extract_info(text)
+        old = legacy_extract_info(text)
+        fields = {key: new[key] for key in old}
+        if fields != old:
+            print(f"❌ Результаты расходятся:\n{text}\nбыло: {old}\nстало: {fields}")
+            return 1
+
+    def per_message_us(fn) -> float:
+        best = min(timeit.repeat(lambda: [fn(t) for t in texts], number=1, repeat=args.repeat))
+        return best / len(texts) * 1e6
+
+    before = per_message_us(legacy_extract_info)
+    after = per_message_us(universal_filter.extract_info)
+    print(f"Сообщений: {len(texts)}, результаты совпадают")
+    print(f"До:    {before:.2f} мкс/сообщение")
+    print(f"После: {after:.2f} мкс/сообщение ({before / after:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
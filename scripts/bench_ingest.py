@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the handler → DB pipeline.
+
+Replays synthetic or recorded messages, shaped like Pyrogram Message objects,
+through handle_channel_message / handle_private_message into a throwaway
+Database. No Telegram session or network access is needed.
+
+Examples:
+    python scripts/bench_ingest.py --messages 100000
+    python scripts/bench_ingest.py --write-behind --concurrency 32 --rate 2000
+    python scripts/bench_ingest.py --lanes 8 --lane-queue-size 500
+    python scripts/bench_ingest.py --from-db parser.db --messages 50000
+    python scripts/bench_ingest.py --json result.json --baseline last.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
+
+# Добавляем корень проекта в path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from channel_registry import ChannelRegistry
+from db import Database
+from dedup import NearDuplicateIndex
+from dispatcher import IngestDispatcher
+from handlers.channel_handler import handle_channel_message
+from handlers.private_handler import handle_private_message
+
+_WORDS = (
+    "нужен разработчик бот telegram python парсер сайт лендинг дизайн логотип "
+    "верстка django fastapi интеграция api crm срочно сегодня задача проект "
+    "доработка ошибка сервер настройка база данных скрипт автоматизация"
+).split()
+
+
+def _fake_message(
+    source: str,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    date: float,
+    chat_username: Optional[str] = None,
+    chat_title: Optional[str] = None,
+    user: Optional[dict] = None,
+):
+    """Object with the Message attributes the handlers read."""
+    from_user = SimpleNamespace(**user) if user else None
+    chat = SimpleNamespace(
+        id=chat_id,
+        type=source,
+        username=chat_username.lstrip("@") if chat_username else None,
+        title=chat_title,
+    )
+    return SimpleNamespace(
+        id=message_id,
+        chat=chat,
+        from_user=from_user,
+        text=text,
+        caption=None,
+        date=datetime.fromtimestamp(date, tz=timezone.utc),
+    )
+
+
+def synthetic_messages(
+    count: int,
+    channels: int,
+    private_ratio: float,
+    duplicate_ratio: float,
+    seed: int,
+) -> Iterator[SimpleNamespace]:
+    """Generate a reproducible message stream with a share of redeliveries."""
+    rng = random.Random(seed)
+    next_id = {}
+    sent = []
+    now = time.time() - count
+    for i in range(count):
+        if sent and rng.random() < duplicate_ratio:
+            # Telegram redelivers updates after reconnects; resend a recent one
+            yield rng.choice(sent[-1000:])
+            continue
+
+        words = rng.choices(_WORDS, k=rng.randint(5, 60))
+        if rng.random() < 0.4:
+            words.append(f"бюджет {rng.randint(1, 300) * 500} руб")
+        text = " ".join(words)
+
+        if rng.random() < private_ratio:
+            chat_id = rng.randint(1, 500)
+            message_id = next_id[("private", chat_id)] = next_id.get(("private", chat_id), 0) + 1
+            user = {"id": chat_id, "username": f"user{chat_id}", "first_name": "User"}
+            message = _fake_message("private", chat_id, message_id, text, now + i, user=user)
+        else:
+            channel = rng.randrange(channels)
+            message_id = next_id[channel] = next_id.get(channel, 0) + 1
+            message = _fake_message(
+                "channel",
+                -1001000000000 - channel,
+                message_id,
+                text,
+                now + i,
+                chat_username=f"bench_channel_{channel}",
+                chat_title=f"Bench channel {channel}",
+            )
+        sent.append(message)
+        yield message
+
+
+def recorded_messages(path: str, count: int) -> Iterator[SimpleNamespace]:
+    """Load messages from a JSON-lines fixture file.
+
+    Each line: {"source", "chat_id", "message_id", "text", "timestamp",
+    "chat_username", "chat_title", "from_user": {"id", "username", "first_name"}}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if count and i >= count:
+                break
+            row = json.loads(line)
+            yield _fake_message(
+                row["source"],
+                row["chat_id"],
+                row["message_id"],
+                row.get("text") or "",
+                row.get("timestamp") or time.time(),
+                chat_username=row.get("chat_username"),
+                chat_title=row.get("chat_title"),
+                user=row.get("from_user"),
+            )
+
+
+def db_messages(path: str, count: int) -> Iterator[SimpleNamespace]:
+    """Replay messages already stored in a parser database (read-only)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            """
+            SELECT source, channel_id, chat_id, channel_username, channel_title,
+                   message_id, text, timestamp, from_user_id, from_username, from_first_name
+            FROM messages ORDER BY id LIMIT ?
+            """,
+            (count or -1,),
+        )
+        for (source, channel_id, chat_id, username, title, message_id, text,
+             timestamp, user_id, user_name, first_name) in rows:
+            user = {"id": user_id, "username": user_name, "first_name": first_name} if user_id else None
+            yield _fake_message(
+                source,
+                channel_id if source == "channel" else chat_id,
+                message_id,
+                text or "",
+                timestamp or time.time(),
+                chat_username=username,
+                chat_title=title,
+                user=user,
+            )
+    finally:
+        conn.close()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def _db_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+async def run_benchmark(messages: List[SimpleNamespace], args) -> dict:
+    """Replay messages through the handlers and collect timings."""
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    db_path = os.path.join(workdir, "bench.db")
+    registry = ChannelRegistry(persist_file=os.path.join(workdir, "channels.json"))
+    registry.add_many(m.chat.username for m in messages if m.chat.type == "channel" and m.chat.username)
+
+    db = Database(
+        db_path,
+        write_behind=args.write_behind,
+        batch_size=args.batch_size,
+        flush_interval_ms=args.flush_interval_ms,
+        recent_keys=args.recent_keys,
+        near_duplicates=NearDuplicateIndex() if args.near_dup else None,
+    )
+    await db.init()
+    empty_size = _db_size(db_path)
+
+    new_latencies: List[float] = []
+    dup_latencies: List[float] = []
+    submit_message = db.submit_message
+
+    async def timed_submit(payload):
+        # Handlers do not wait for the commit; latency runs until it resolves
+        started = time.perf_counter()
+        future = await submit_message(payload)
+
+        def record(done):
+            if not done.cancelled() and done.exception() is None:
+                latencies = new_latencies if done.result() else dup_latencies
+                latencies.append(time.perf_counter() - started)
+
+        future.add_done_callback(record)
+        return future
+
+    db.submit_message = timed_submit
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = set()
+
+    async def dispatch(message):
+        try:
+            await handle(message)
+        finally:
+            semaphore.release()
+
+    async def handle(message):
+        if message.chat.type == "channel":
+            await handle_channel_message(None, message, db, registry)
+        else:
+            await handle_private_message(None, message, db, registry)
+
+    # Same path as main.py with INGEST_LANES: one feeder, per-chat ordered lanes
+    dispatcher = IngestDispatcher(args.lanes, args.lane_queue_size) if args.lanes else None
+    if dispatcher is not None:
+        dispatcher.start()
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for i, message in enumerate(messages):
+        if args.rate:
+            # Open-loop pacing: message i is due at started + i / rate
+            delay = started + i / args.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if dispatcher is not None:
+            await dispatcher.submit(message.chat.id, handle, message)
+            continue
+        await semaphore.acquire()
+        task = asyncio.create_task(dispatch(message))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+    if dispatcher is not None:
+        await dispatcher.close()
+    await db.drain()
+    elapsed = loop.time() - started
+
+    await registry.flush()
+    cache = db.recent_keys_stats()
+    await db.close()
+    # Fold the WAL into the main file so the size reflects stored data
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    growth = _db_size(db_path) - empty_size
+
+    new_latencies.sort()
+    dup_latencies.sort()
+    inserted = len(new_latencies)
+    result = {
+        "messages": len(messages),
+        "inserted": inserted,
+        "duplicates": len(dup_latencies),
+        "elapsed_s": elapsed,
+        "msgs_per_sec": len(messages) / elapsed if elapsed else 0.0,
+        "insert_p50_ms": _percentile(new_latencies, 50) * 1000,
+        "insert_p99_ms": _percentile(new_latencies, 99) * 1000,
+        "duplicate_p50_ms": _percentile(dup_latencies, 50) * 1000,
+        "duplicate_p99_ms": _percentile(dup_latencies, 99) * 1000,
+        "db_growth_bytes": growth,
+        "mb_per_100k": growth / inserted * 100_000 / 1024 / 1024 if inserted else 0.0,
+        "recent_keys_hit_rate": cache.get("hit_rate", 0.0),
+    }
+
+    if args.keep_db:
+        result["db_path"] = db_path
+    else:
+        for name in os.listdir(workdir):
+            os.unlink(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    return result
+
+
+def print_report(result: dict, args) -> None:
+    mode = f"write-behind (batch {args.batch_size})" if args.write_behind else "direct"
+    if args.near_dup:
+        mode += " + near-dup"
+    workers = f"{args.lanes} lanes" if args.lanes else f"concurrency {args.concurrency}"
+    print(f"Mode: {mode}, {workers}, rate {args.rate or 'max'} msg/s")
+    print(f"Messages:   {result['messages']} ({result['inserted']} new, {result['duplicates']} duplicate)")
+    print(f"Elapsed:    {result['elapsed_s']:.2f} s")
+    print(f"Throughput: {result['msgs_per_sec']:.0f} msg/s")
+    print(f"Insert:     p50 {result['insert_p50_ms']:.2f} ms, p99 {result['insert_p99_ms']:.2f} ms")
+    print(f"Duplicate:  p50 {result['duplicate_p50_ms']:.2f} ms, p99 {result['duplicate_p99_ms']:.2f} ms")
+    if args.recent_keys:
+        print(f"Recent-key cache hit rate: {result['recent_keys_hit_rate']:.1%}")
+    print(f"DB growth:  {result['db_growth_bytes'] / 1024 / 1024:.1f} MB "
+          f"({result['mb_per_100k']:.1f} MB per 100k messages)")
+    if "db_path" in result:
+        print(f"Database kept at {result['db_path']}")
+
+
+def check_regression(result: dict, baseline_path: str, tolerance: float) -> bool:
+    """Compare with a previous --json result; False if throughput or p99 regressed."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    ok = True
+    if result["msgs_per_sec"] < baseline["msgs_per_sec"] * (1 - tolerance):
+        print(f"REGRESSION: throughput {result['msgs_per_sec']:.0f} msg/s "
+              f"vs baseline {baseline['msgs_per_sec']:.0f} msg/s")
+        ok = False
+    if baseline["insert_p99_ms"] and result["insert_p99_ms"] > baseline["insert_p99_ms"] * (1 + tolerance):
+        print(f"REGRESSION: insert p99 {result['insert_p99_ms']:.2f} ms "
+              f"vs baseline {baseline['insert_p99_ms']:.2f} ms")
+        ok = False
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline ingestion benchmark")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages to replay")
+    parser.add_argument("--channels", type=int, default=50, help="Synthetic channels")
+    parser.add_argument("--private-ratio", type=float, default=0.1, help="Share of private messages")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05, help="Share of redelivered messages")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for synthetic data")
+    parser.add_argument("--fixtures", help="Replay a JSON-lines fixture file instead")
+    parser.add_argument("--from-db", help="Replay messages from an existing parser database")
+    parser.add_argument("--rate", type=float, default=0, help="Messages per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Handlers in flight (Pyrogram workers)")
+    parser.add_argument("--lanes", type=int, default=0, help="Use the ingestion dispatcher with N lanes")
+    parser.add_argument("--lane-queue-size", type=int, default=1000, help="Dispatcher queue size per lane")
+    parser.add_argument("--write-behind", action="store_true", help="Use the write-behind pipeline")
+    parser.add_argument("--batch-size", type=int, default=100, help="Write-behind batch size")
+    parser.add_argument("--flush-interval-ms", type=int, default=50, help="Write-behind flush interval")
+    parser.add_argument("--recent-keys", type=int, default=50000,
+                        help="In-memory recent-message cache size (0 = disabled)")
+    parser.add_argument("--near-dup", action="store_true",
+                        help="Attach a near-duplicate index (as with NEAR_DUP_WINDOW > 0)")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the benchmark database")
+    parser.add_argument("--json", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous --json result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression vs baseline")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        messages = list(recorded_messages(args.fixtures, args.messages))
+    elif args.from_db:
+        messages = list(db_messages(args.from_db, args.messages))
+    else:
+        messages = list(synthetic_messages(
+            args.messages, args.channels, args.private_ratio, args.duplicate_ratio, args.seed
+        ))
+
+    result = asyncio.run(run_benchmark(messages, args))
+    print_report(result, args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and not check_regression(result, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
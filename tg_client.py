@@ -1,12 +1,20 @@
 import logging
+from typing import Optional
 from pyrogram import Client, filters
 from config import TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_SESSION_NAME
+from metrics import MESSAGES_RECEIVED
+from profiling import profiler
 
 logger = logging.getLogger("parser.tg_client")
 
 
-def build_client() -> Client:
-    """Create and return a Pyrogram client."""
+def build_client(workers: Optional[int] = None) -> Client:
+    """Create and return a Pyrogram client.
+
+    Args:
+        workers: Pyrogram update workers (None = Pyrogram default)
+    """
+    kwargs = {"workers": workers} if workers else {}
     app = Client(
         name=TELEGRAM_SESSION_NAME,
         api_id=int(TELEGRAM_API_ID),
@@ -14,30 +22,51 @@ def build_client() -> Client:
         workdir="memory/telegram_sessions",
         device_model="Python Script",
         app_version="1.0",
-        system_version="Linux"
+        system_version="Linux",
+        **kwargs,
     )
     logger.info(f"Created Pyrogram client with session {TELEGRAM_SESSION_NAME}")
     return app
 
 
-def register_handlers(app: Client, db, registry) -> None:
-    """Register message handlers for channels and private messages."""
+def register_handlers(app: Client, db, registry, dispatcher=None) -> None:
+    """Register message handlers for channels and private messages.
+
+    With a dispatcher.IngestDispatcher the handlers only enqueue the update
+    on its chat's lane; the work runs there, in order per chat.
+    """
     # Import handlers here to avoid circular imports
     from handlers.channel_handler import handle_channel_message
     from handlers.private_handler import handle_private_message
     from voice_handler import register_voice_handler
 
+    # Timed wrappers in profiling mode, the plain functions otherwise
+    handle_channel_message = profiler.wrap(handle_channel_message)
+    handle_private_message = profiler.wrap(handle_private_message)
+
     # Register channel message handler
     @app.on_message(filters.channel)
     async def on_channel_message(client, message):
-        await handle_channel_message(client, message, db, registry)
+        MESSAGES_RECEIVED.inc("channel", message.chat.username or str(message.chat.id))
+        if dispatcher is not None:
+            await dispatcher.submit(
+                message.chat.id, handle_channel_message, client, message, db, registry
+            )
+        else:
+            await handle_channel_message(client, message, db, registry)
 
     # Register private message handler
     @app.on_message(filters.private)
     async def on_private_message(client, message):
-        await handle_private_message(client, message, db, registry)
+        MESSAGES_RECEIVED.inc("private", "")
+        if dispatcher is not None:
+            await dispatcher.submit(
+                message.chat.id, handle_private_message, client, message, db, registry
+            )
+        else:
+            await handle_private_message(client, message, db, registry)
 
     # Register voice message handler
-    register_voice_handler(app, db, registry)
+    register_voice_handler(app, db, registry, dispatcher)
 
     logger.info("Message handlers registered")
@@ -1,104 +1,522 @@
+import asyncio
+import bisect
+import hashlib
 import logging
-import os
-import tempfile
-from typing import Optional
-from faster_whisper import WhisperModel
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, List, Optional, Tuple, Union
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
 from pyrogram import filters
+from pyrogram.enums import ChatType
+from config import (
+    VOICE_WORKERS,
+    VOICE_QUEUE_SIZE,
+    VOICE_BATCH_SIZE,
+    VOICE_BATCH_WINDOW_MS,
+    VOICE_MODEL,
+    VOICE_FAST_MODEL,
+    VOICE_DEVICE,
+    VOICE_COMPUTE_TYPE,
+    VOICE_FAST_MAX_SECONDS,
+    VOICE_MIN_AVG_LOGPROB,
+)
+from filters.rules import rule_engine
+from metrics import MESSAGES_FILTERED, QUEUE_DEPTH, WHISPER_CLIPS, WHISPER_LATENCY
+from profiling import profiler
+
+try:
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:  # faster-whisper < 1.1: распознаём клипы по одному
+    BatchedInferencePipeline = None
 
 logger = logging.getLogger("parser.voice_handler")
 
-# Инициализация Whisper
-VOICE_MODEL = "medium"
-voice_model = None
+# Частота дискретизации, которую ожидает Whisper
+SAMPLE_RATE = 16000
+# Whisper обрабатывает окна не длиннее 30 секунд
+CHUNK_SAMPLES = 30 * SAMPLE_RATE
+
+# Загруженные модели и пакетные пайплайны по имени модели
+voice_models = {}
+batched_pipelines = {}
+_model_lock = threading.Lock()
+
+# Пул потоков для Whisper: транскрибация не блокирует event loop
+_executor = ThreadPoolExecutor(max_workers=VOICE_WORKERS, thread_name_prefix="whisper")
+# Задачи в работе + ожидающие в очереди
+_pending = 0
+
+# Статистика кэша транскрипций (повторно пересланные голосовые)
+cache_stats = {"hits": 0, "misses": 0}
+
+QUEUE_DEPTH.set_function(lambda: _pending, "whisper")
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
 
+class VoiceQueueFull(Exception):
+    """Очередь распознавания переполнена, сообщение отброшено"""
 
-def get_voice_model():
+
+def get_voice_model(name: str = VOICE_MODEL):
     """Загружает модель Whisper с кэшированием"""
-    global voice_model
-    if voice_model is None:
-        logger.info(f"Загрузка модели Whisper: {VOICE_MODEL}")
-        voice_model = WhisperModel(VOICE_MODEL, device="auto", compute_type="int8")
-        logger.info("Whisper готов!")
-    return voice_model
+    with _model_lock:
+        if name not in voice_models:
+            logger.info(f"Загрузка модели Whisper: {name}")
+            voice_models[name] = WhisperModel(
+                name,
+                device=VOICE_DEVICE,
+                compute_type=VOICE_COMPUTE_TYPE,
+                num_workers=VOICE_WORKERS,
+            )
+            logger.info(f"Whisper {name} готов!")
+    return voice_models[name]
+
+
+def get_batched_pipeline(name: str = VOICE_MODEL):
+    """Пакетный пайплайн faster-whisper поверх общей модели"""
+    model = get_voice_model(name)
+    with _model_lock:
+        if name not in batched_pipelines:
+            batched_pipelines[name] = BatchedInferencePipeline(model=model)
+    return batched_pipelines[name]
 
 
-async def transcribe_voice(audio_path: str) -> str:
-    """Распознаёт речь из аудиофайла"""
+def _warm_up_sync():
+    """Загружает модели и прогоняет секунду тишины, чтобы первый клип не ждал"""
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    for name in filter(None, dict.fromkeys([VOICE_FAST_MODEL, VOICE_MODEL])):
+        segments, _ = get_voice_model(name).transcribe(silence, language="ru")
+        list(segments)
+
+
+async def preload_voice_models():
+    """Фоновая загрузка и прогрев моделей при старте"""
     try:
-        model = get_voice_model()
-        
-        # Транскрибация
-        segments, info = model.transcribe(
-            audio_path,
-            beam_size=5,
-            language="ru"  # Русский язык
-        )
-        
-        text = "".join(segment.text for segment in segments)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_executor, _warm_up_sync)
+        logger.info("Модели Whisper загружены и прогреты")
+    except Exception as e:
+        logger.error(f"Ошибка предзагрузки Whisper: {e}", exc_info=True)
+
+
+def decode_voice(audio: BinaryIO) -> np.ndarray:
+    """Декодирует OGG/Opus из памяти в float32 PCM 16 кГц (моно)"""
+    audio.seek(0)
+    return decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+
+def _mean_logprob(segments) -> float:
+    """Средний avg_logprob сегментов (уверенность модели)"""
+    if not segments:
+        return float("-inf")
+    return sum(segment.avg_logprob for segment in segments) / len(segments)
+
+
+def _run_model(name: str, arrays: List[np.ndarray]) -> List[Tuple[str, float]]:
+    """Распознаёт клипы одной моделью, возвращает (текст, уверенность) на клип
+
+    Несколько клипов склеиваются в один массив, каждый режется на окна по
+    30 секунд, окна передаются пакетом через clip_timestamps (в секундах,
+    как их читает faster-whisper 1.1+). Окно не переходит границу клипа,
+    поэтому сегмент возвращается к своему клипу по времени начала.
+    """
+    if not arrays:
+        return []
+
+    if len(arrays) == 1 or BatchedInferencePipeline is None:
+        results = []
+        for audio in arrays:
+            # Генератор сегментов тоже считается здесь, а не в event loop
+            segments, info = get_voice_model(name).transcribe(
+                audio,
+                beam_size=5,
+                language="ru"  # Русский язык
+            )
+            segments = list(segments)
+            results.append(("".join(s.text for s in segments), _mean_logprob(segments)))
+        return results
+
+    starts = []
+    clip_timestamps = []
+    offset = 0
+    for array in arrays:
+        end = offset + len(array)
+        starts.append(offset / SAMPLE_RATE)
+        for chunk_start in range(offset, end, CHUNK_SAMPLES):
+            chunk_end = min(chunk_start + CHUNK_SAMPLES, end)
+            clip_timestamps.append({"start": chunk_start / SAMPLE_RATE, "end": chunk_end / SAMPLE_RATE})
+        offset = end
+
+    segments, info = get_batched_pipeline(name).transcribe(
+        np.concatenate(arrays),
+        language="ru",
+        beam_size=5,
+        batch_size=min(len(clip_timestamps), max(1, VOICE_BATCH_SIZE)),
+        clip_timestamps=clip_timestamps,
+        vad_filter=False,
+    )
+
+    per_clip = [[] for _ in arrays]
+    for segment in segments:
+        # Небольшой допуск на округление смещения окна
+        index = bisect.bisect_right(starts, segment.start + 1e-3) - 1
+        per_clip[max(index, 0)].append(segment)
+    return [("".join(s.text for s in clip), _mean_logprob(clip)) for clip in per_clip]
+
+
+def _transcribe_batch_sync(clips: List[Union[BinaryIO, np.ndarray]]) -> List[str]:
+    """Декодирует и распознаёт пакет клипов
+
+    При заданной VOICE_FAST_MODEL короткие клипы сначала идут в быструю
+    модель; длинные и распознанные неуверенно (avg_logprob ниже порога)
+    распознаются основной моделью.
+    """
+    arrays = []
+    for clip in clips:
+        try:
+            arrays.append(clip if isinstance(clip, np.ndarray) else decode_voice(clip))
+        except Exception as e:
+            # Битый файл не должен ронять весь пакет
+            logger.error(f"Ошибка декодирования: {e}")
+            arrays.append(np.zeros(0, dtype=np.float32))
+
+    texts: List[Optional[str]] = [None if len(a) else "" for a in arrays]
+
+    if VOICE_FAST_MODEL and VOICE_FAST_MODEL != VOICE_MODEL:
+        short = [
+            i for i, a in enumerate(arrays)
+            if 0 < len(a) <= VOICE_FAST_MAX_SECONDS * SAMPLE_RATE
+        ]
+        fast_results = _run_model(VOICE_FAST_MODEL, [arrays[i] for i in short])
+        for i, (text, logprob) in zip(short, fast_results):
+            if text.strip() and logprob >= VOICE_MIN_AVG_LOGPROB:
+                texts[i] = text
+            else:
+                logger.debug(f"Низкая уверенность ({logprob:.2f}), повтор на {VOICE_MODEL}")
+
+    rest = [i for i, text in enumerate(texts) if text is None]
+    for i, (text, _) in zip(rest, _run_model(VOICE_MODEL, [arrays[i] for i in rest])):
+        texts[i] = text
+    return texts
+
+
+class TranscriptionScheduler:
+    """Собирает голосовые за короткое окно и распознаёт их пакетом
+
+    Пакет отправляется в пул, когда набрано batch_size клипов или прошло
+    window_ms с момента прихода первого из них (потолок ожидания клипа).
+    """
+
+    def __init__(self, batch_size: int, window_ms: int):
+        self.batch_size = max(1, batch_size)
+        self.window_ms = max(0, window_ms)
+        self._queue = None
+        self._task = None
+        self._batches = set()
+
+    async def transcribe(self, audio: Union[BinaryIO, np.ndarray]) -> str:
+        """Ставит клип в очередь и ждёт его текст"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((audio, future))
+        return await future
+
+    async def _collect(self):
+        """Формирует пакеты из очереди"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_ms / 1000
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Следующее окно собирается, пока этот пакет ждёт поток пула
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        """Распознаёт пакет и раздаёт результаты по сообщениям"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            texts = await loop.run_in_executor(
+                _executor, profiler.wrap(_transcribe_batch_sync), [audio for audio, _ in batch]
+            )
+        except Exception as e:
+            WHISPER_CLIPS.inc("error", amount=len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        WHISPER_LATENCY.observe(time.monotonic() - started)
+        for text in texts:
+            WHISPER_CLIPS.inc("ok" if text.strip() else "empty")
+        if len(batch) > 1:
+            logger.info(f"Распознан пакет из {len(batch)} голосовых")
+        for (_, future), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
+
+
+_scheduler = TranscriptionScheduler(VOICE_BATCH_SIZE, VOICE_BATCH_WINDOW_MS)
+
+
+async def transcribe_voice(audio: Union[BinaryIO, np.ndarray]) -> Optional[str]:
+    """Распознаёт речь в пуле потоков
+
+    Args:
+        audio: OGG/Opus в памяти (BytesIO) или уже декодированный PCM 16 кГц
+
+    Raises:
+        VoiceQueueFull: если в очереди уже VOICE_QUEUE_SIZE ожидающих задач
+    """
+    global _pending
+    if _pending >= VOICE_WORKERS + VOICE_QUEUE_SIZE:
+        logger.warning(f"Очередь распознавания заполнена ({_pending}), голосовое отброшено")
+        WHISPER_CLIPS.inc("queue_full")
+        raise VoiceQueueFull()
+
+    _pending += 1
+    try:
+        text = await _scheduler.transcribe(audio)
         logger.info(f"Распознано: {text}")
         return text.strip()
-        
+
     except Exception as e:
         logger.error(f"Ошибка транскрипции: {e}", exc_info=True)
         return None
+    finally:
+        _pending -= 1
 
 
-async def convert_audio(input_path: str, output_format: str = "wav") -> str:
-    """Конвертирует аудио (OGG → WAV для Whisper)"""
-    try:
-        from pydub import AudioSegment
-        
-        audio = AudioSegment.from_file(input_path)
-        
-        # Создаём временный файл
-        temp_file = tempfile.NamedTemporaryFile(
-            delete=False, 
-            suffix=f".{output_format}"
+async def _cached_transcribe(message, db) -> Optional[str]:
+    """Транскрибация с кэшем по file_unique_id, затем по хэшу аудио
+
+    Попадание по file_unique_id пропускает и скачивание, и Whisper.
+    """
+    file_key = f"file:{message.voice.file_unique_id}"
+    text = await db.get_cached_transcription(file_key)
+    if text is not None:
+        cache_stats["hits"] += 1
+        WHISPER_CLIPS.inc("cache_hit")
+        return text
+
+    # Скачиваем файл в память, без временных файлов на диске
+    audio = await message.download(in_memory=True)
+    if not audio:
+        return None
+
+    hash_key = f"sha256:{hashlib.sha256(audio.getbuffer()).hexdigest()}"
+    text = await db.get_cached_transcription(hash_key)
+    if text is not None:
+        cache_stats["hits"] += 1
+        WHISPER_CLIPS.inc("cache_hit")
+        await db.cache_transcription([file_key], text)
+        return text
+
+    cache_stats["misses"] += 1
+    text = await transcribe_voice(audio)
+    if text:
+        await db.cache_transcription([file_key, hash_key], text)
+    return text
+
+
+def _build_payload(message, registry) -> Optional[dict]:
+    """Payload для сохранения голосового в БД
+
+    Возвращает None, если чат не отслеживается (неактивный канал, группа
+    или бот выключен).
+    """
+    chat = message.chat
+    from_user = message.from_user
+    payload = {
+        "message_id": message.id,
+        "text": message.caption or "",
+        "timestamp": message.date.timestamp() if message.date else None,
+        "from_user": {
+            "id": from_user.id,
+            "username": from_user.username,
+            "first_name": from_user.first_name,
+        } if from_user else None,
+    }
+
+    if chat.type == ChatType.CHANNEL:
+        if not registry.is_active_chat(chat):
+            return None
+        payload.update(
+            source="channel",
+            channel_id=chat.id,
+            channel_username=chat.username,
+            channel_title=chat.title or "",
         )
-        audio.export(temp_file.name, format=output_format)
-        
-        logger.info(f"Конвертация: {input_path} → {temp_file.name}")
-        return temp_file.name
-        
-    except Exception as e:
-        logger.error(f"Ошибка конвертации: {e}", exc_info=True)
+    elif chat.type in (ChatType.PRIVATE, ChatType.BOT):
+        if not registry.enabled:
+            return None
+        payload.update(source="private", chat_id=chat.id)
+    else:
         return None
+    return payload
+
+
+def _apply_rules(payload: dict, text: str) -> bool:
+    """Правила канала для голосового, как в handle_channel_message
+
+    Дописывает в payload извлечённые поля; False — сообщение отфильтровано.
+    """
+    channel_key = payload["channel_username"] or str(payload["channel_id"])
+    info = rule_engine.match(channel_key, text)
+    if info is None:
+        logger.debug(f"Голосовое отфильтровано правилами: {channel_key}")
+        MESSAGES_FILTERED.inc("channel", channel_key, "filter")
+        return False
+    payload["price"] = info.get("price") or None  # 0 = цена не найдена
+    payload["urgency"] = info.get("urgency")
+    payload["title"] = info.get("title")
+    payload["tags"] = info.get("tags")
+    return True
+
+
+async def drain_background_tasks(timeout: float = 60) -> None:
+    """Дожидается фоновых транскрибаций и записей транскриптов (при остановке)
+
+    Вызывается до закрытия диспетчера и БД; не успевшие за timeout секунд
+    задачи отменяются.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Колбэки уже закоммиченных строк могут ещё создать задачи set_transcript
+    await asyncio.sleep(0)
+    while _background_tasks:
+        _, pending = await asyncio.wait(set(_background_tasks), timeout=max(0, deadline - loop.time()))
+        if pending and loop.time() >= deadline:
+            logger.warning(f"Остановка: отменено {len(pending)} незавершённых голосовых")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+        await asyncio.sleep(0)
 
 
-async def handle_voice_message(message, db, registry):
-    """Обработчик голосовых сообщений"""
+async def _store_transcript(db, payload: dict, text: str) -> None:
+    """Сохраняет голосовое; если сообщение уже записано основным хендлером — дописывает транскрипт
+
+    Коммит вставки не ждём (submit_message), чтобы не держать полосу чата:
+    если строка уже была в очереди записи, транскрипт дописывается, когда
+    она закоммитится.
+    """
+    payload["transcript"] = text
+    future = await db.submit_message(payload)
+    if future.done():
+        if not future.exception() and not future.result():
+            await db.set_transcript(payload, text)
+        return
+
+    def on_stored(done):
+        if not done.cancelled() and not done.exception() and not done.result():
+            task = asyncio.create_task(db.set_transcript(payload, text))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    future.add_done_callback(on_stored)
+
+
+async def handle_voice_message(message, db, registry, defer_write=None):
+    """Обработчик голосовых сообщений
+
+    Транскрипт сохраняется в колонку transcript сообщения; в личке и группах
+    бот дополнительно отвечает текстом, в каналах только сохраняет.
+
+    defer_write(fn, *args) — куда отдать запись в БД (полоса чата у
+    диспетчера); без него запись выполняется здесь же.
+    """
+    is_channel = message.chat.type == ChatType.CHANNEL
+    payload = _build_payload(message, registry)
+    if is_channel and payload is None:
+        logger.debug(f"Канал {message.chat.username or message.chat.id} не активен, голосовое пропущено")
+        return
+    # С подписью правила проверяются до дорогой транскрибации
+    if is_channel and payload["text"] and not _apply_rules(payload, payload["text"]):
+        return
+
     try:
-        # Получаем файл
-        file = await message.download()
-        
-        # Конвертируем OGG → WAV
-        wav_path = await convert_audio(file)
-        
-        if not wav_path:
-            await message.answer("❌ Не смог обработать голосовое сообщение")
+        # Кэш, скачивание, декодирование и транскрибация
+        try:
+            text = await _cached_transcribe(message, db)
+        except VoiceQueueFull:
+            if not is_channel:
+                await message.reply("⏳ Слишком много голосовых, попробуйте позже")
             return
         
-        # Транскрибируем
-        text = await transcribe_voice(wav_path)
-        
         if not text:
-            await message.answer("❌ Не удалось распознать речь")
+            if not is_channel:
+                await message.reply("❌ Не удалось распознать речь")
             return
         
+        total = cache_stats["hits"] + cache_stats["misses"]
+        logger.debug(f"Кэш транскрипций: {cache_stats['hits']}/{total} попаданий")
+
+        # Без подписи правила канала применяются к транскрипту
+        if is_channel and not payload["text"] and not _apply_rules(payload, text):
+            return
+
+        if payload is not None:
+            if defer_write is None:
+                await _store_transcript(db, payload, text)
+            else:
+                await defer_write(_store_transcript, db, payload, text)
+
         # Отправляем текст и ответ
-        await message.answer(f"🎤 **Голосовое:**\n{text}")
-        
-        # Удаляем временный файл
-        os.unlink(wav_path)
+        if not is_channel:
+            await message.reply(f"🎤 **Голосовое:**\n{text}")
         
     except Exception as e:
         logger.error(f"Ошибка обработки голосового: {e}", exc_info=True)
-        await message.answer("❌ Ошибка при обработке")
+        if not is_channel:
+            await message.reply("❌ Ошибка при обработке")
+
+
+def register_voice_handler(app, db, registry, dispatcher=None):
+    """Регистрирует хендлер голосовых сообщений
 
+    Группа 1: в группе 0 голосовое уже забирает хендлер канала или лички,
+    а Pyrogram вызывает только первый подходящий хендлер в группе.
 
-def register_voice_handler(app, db, registry):
-    """Регистрирует хендлер голосовых сообщений"""
-    @app.on_message(filters.voice)
+    С диспетчером транскрибация идёт отдельной задачей и не занимает полосу
+    (иначе минутный Whisper задержал бы все чаты этой полосы); в полосу
+    своего чата встаёт только запись транскрипта — после строки из группы 0.
+    """
+    handler = profiler.wrap(handle_voice_message)
+
+    async def process(message, defer_write=None):
+        await handler(message, db, registry, defer_write)
+        sender = message.from_user.username if message.from_user else message.chat.title
+        logger.info(f"Обработан голосовой от {sender}")
+
+    @app.on_message(filters.voice, group=1)
     async def on_voice_message(client, message):
-        await handle_voice_message(message, db, registry)
-        logger.info(f"Обработан голосовой от {message.from_user.username}")
+        if dispatcher is None:
+            await process(message)
+            return
+
+        chat_id = message.chat.id
+
+        async def defer_write(fn, *args):
+            await dispatcher.submit(chat_id, fn, *args)
+
+        task = asyncio.create_task(process(message, defer_write))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)